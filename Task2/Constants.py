@@ -7,3 +7,44 @@ PG_DB: str = os.getenv("PG_DB", "coursedb")
 JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
 JWT_ALGORITHM: str = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+PREDICT_BATCH_MAX_SIZE: int = int(os.getenv("PREDICT_BATCH_MAX_SIZE", 5000))
+DEVICE_CACHE_SIZE: int = int(os.getenv("DEVICE_CACHE_SIZE", 10000))
+DEVICE_CACHE_TTL_SECONDS: float = float(os.getenv("DEVICE_CACHE_TTL_SECONDS", 300))
+CONFIG_CACHE_SIZE: int = int(os.getenv("CONFIG_CACHE_SIZE", 10000))
+CONFIG_CACHE_TTL_SECONDS: float = float(os.getenv("CONFIG_CACHE_TTL_SECONDS", 600))
+INGEST_MODE: str = os.getenv("INGEST_MODE", "sync")
+INGEST_BUFFER_MAX_ROWS: int = int(os.getenv("INGEST_BUFFER_MAX_ROWS", 50000))
+INGEST_FLUSH_ROWS: int = int(os.getenv("INGEST_FLUSH_ROWS", 1000))
+INGEST_FLUSH_INTERVAL_MS: int = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 200))
+INGEST_RETRY_MAX_BACKOFF_SECONDS: float = float(os.getenv("INGEST_RETRY_MAX_BACKOFF_SECONDS", 5))
+INGEST_SHUTDOWN_TIMEOUT_SECONDS: float = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT_SECONDS", 30))
+INGEST_DURABLE_TIMEOUT_SECONDS: float = float(os.getenv("INGEST_DURABLE_TIMEOUT_SECONDS", 10))
+SKETCH_RELATIVE_ACCURACY: float = float(os.getenv("SKETCH_RELATIVE_ACCURACY", 0.01))
+STATS_STREAM_CHUNK_ROWS: int = int(os.getenv("STATS_STREAM_CHUNK_ROWS", 50000))
+MEASUREMENT_PARTITIONS_AHEAD: int = int(os.getenv("MEASUREMENT_PARTITIONS_AHEAD", 3))
+PARTITION_MAINTENANCE_INTERVAL_SECONDS: float = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", 86400))
+STATS_CACHE_MAX_BYTES: int = int(os.getenv("STATS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+STATS_CACHE_LIVE_TTL_SECONDS: float = float(os.getenv("STATS_CACHE_LIVE_TTL_SECONDS", 60))
+STATS_CACHE_EVENT_LOG_SIZE: int = int(os.getenv("STATS_CACHE_EVENT_LOG_SIZE", 10000))
+TRENDS_MAX_POINTS_LIMIT: int = int(os.getenv("TRENDS_MAX_POINTS_LIMIT", 10000))
+EXPORT_CHUNK_ROWS: int = int(os.getenv("EXPORT_CHUNK_ROWS", 10000))
+IMPORT_CHUNK_ROWS: int = int(os.getenv("IMPORT_CHUNK_ROWS", 50000))
+DEVICE_MEASUREMENTS_PAGE_SIZE: int = int(os.getenv("DEVICE_MEASUREMENTS_PAGE_SIZE", 50))
+DEVICE_MEASUREMENTS_PAGE_LIMIT: int = int(os.getenv("DEVICE_MEASUREMENTS_PAGE_LIMIT", 1000))
+MEASUREMENTS_PAGE_SIZE: int = int(os.getenv("MEASUREMENTS_PAGE_SIZE", 100))
+MEASUREMENTS_PAGE_LIMIT: int = int(os.getenv("MEASUREMENTS_PAGE_LIMIT", 1000))
+CONFIG_STREAM_HEARTBEAT_SECONDS: float = float(os.getenv("CONFIG_STREAM_HEARTBEAT_SECONDS", 15))
+CONFIG_STREAM_RETRY_MS: int = int(os.getenv("CONFIG_STREAM_RETRY_MS", 5000))
+CONFIG_EVENTS_RECONNECT_SECONDS: float = float(os.getenv("CONFIG_EVENTS_RECONNECT_SECONDS", 5))
+CONFIG_IMPORT_CHUNK_SIZE: int = int(os.getenv("CONFIG_IMPORT_CHUNK_SIZE", 1000))
+SURFACE_MAX_GRID_POINTS: int = int(os.getenv("SURFACE_MAX_GRID_POINTS", 8_000_000))
+SURFACE_MAX_RESPONSE_POINTS: int = int(os.getenv("SURFACE_MAX_RESPONSE_POINTS", 250_000))
+SURFACE_DEFAULT_AXIS_POINTS: int = int(os.getenv("SURFACE_DEFAULT_AXIS_POINTS", 50))
+AUTH_USER_CACHE_SIZE: int = int(os.getenv("AUTH_USER_CACHE_SIZE", 10000))
+AUTH_USER_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", 30))
+AUTH_STATELESS_TOKENS: bool = os.getenv("AUTH_STATELESS_TOKENS", "false").lower() == "true"
+BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", 5))
@@ -1,32 +1,70 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
-from passlib.context import CryptContext
+from typing import Dict, Optional
 
+from cache import TTLCache
 from models.user import User
 from get_db import get_db
-from Constants import JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from Constants import JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, AUTH_USER_CACHE_SIZE, \
+    AUTH_USER_CACHE_TTL_SECONDS, AUTH_STATELESS_TOKENS
 from logger import logger
+from services.password_hasher import password_hasher, PasswordHasherBusy
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+@dataclass(frozen=True)
+class AuthUser:
+    id: int
+    username: str
+    role: str
+    is_banned: bool
+    token_version: int
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
 
+# username -> AuthUser; захищені ендпоінти не звертаються до БД, поки запис живий
+user_cache = TTLCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL_SECONDS)
+# Мінімальна дійсна версія токена після відкликання в цьому процесі — для AUTH_STATELESS_TOKENS,
+# де запис кешу відновлюється з самого токена
+_min_token_versions: Dict[str, int] = {}
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
 
+def invalidate_user(username: str, token_version: Optional[int] = None):
+    user_cache.pop(username)
+    if token_version is not None:
+        _min_token_versions[username] = token_version
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.password_hash):
+
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Забагато одночасних запитів автентифікації, спробуйте пізніше",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+    if not user or not await verify_password(password, user.password_hash):
         return False
     return user
 
@@ -42,22 +80,25 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def login_for_access_token(db: Session, username: str, password: str):
-    user = authenticate_user(db, username, password)
+def create_user_token(user: User) -> str:
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "role": user.role, "ver": user.token_version or 0},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+
+async def login_for_access_token(db: AsyncSession, username: str, password: str):
+    user = await authenticate_user(db, username, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неправильне ім'я користувача або пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": create_user_token(user), "token_type": "bearer"}
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> AuthUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Необхідна авторизація",
@@ -70,19 +111,41 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+
+    version = payload.get("ver")
+    user = user_cache.get(username)
+    if user is not None and version is not None and version > user.token_version:
+        # Токен новіший за запис кешу — користувача змінено в іншому воркері
+        user = None
+    if user is None and AUTH_STATELESS_TOKENS and all(claim in payload for claim in ("uid", "role", "ver")):
+        # Роль і версія беруться з токена без запиту до БД. Відкликання в інших воркерах
+        # у цьому режимі діє лише після закінчення строку дії токена
+        if version < _min_token_versions.get(username, 0):
+            raise credentials_exception
+        user = AuthUser(id=payload["uid"], username=username, role=payload["role"], is_banned=False,
+                        token_version=version)
+        user_cache.set(username, user)
+    elif user is None:
+        db_user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+        if db_user is None:
+            raise credentials_exception
+        user = AuthUser(id=db_user.id, username=db_user.username, role=db_user.role,
+                        is_banned=bool(db_user.is_banned), token_version=db_user.token_version or 0)
+        user_cache.set(username, user)
+
+    # Токени без версії видані до її появи й дійсні до закінчення строку дії
+    if version is not None and version != user.token_version:
         raise credentials_exception
     return user
 
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: AuthUser = Depends(get_current_user)):
     if current_user.is_banned:
         raise HTTPException(status_code=400, detail="Користувач заблокований")
     return current_user
 
 
-def get_current_admin(current_user: User = Depends(get_current_active_user)):
+def get_current_admin(current_user: AuthUser = Depends(get_current_active_user)):
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -91,7 +154,7 @@ def get_current_admin(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 
-def get_current_manager_or_admin(current_user: User = Depends(get_current_active_user)):
+def get_current_manager_or_admin(current_user: AuthUser = Depends(get_current_active_user)):
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
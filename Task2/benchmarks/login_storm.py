@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+# Навантажувальний тест: паралельні входи і одночасне опитування ендпоінта, не пов'язаного з автентифікацією.
+# Показує пропускну здатність входів і затримки стороннього ендпоінта (p50/p99) під час шторму входів.
+# Приклад: python benchmarks/login_storm.py --username admin --password 'Secret1!' --concurrency 50
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def login_worker(client: httpx.AsyncClient, args, deadline: float, latencies: List[float], statuses: dict):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/api/auth/login", data={"username": args.username, "password": args.password})
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def probe_worker(client: httpx.AsyncClient, args, deadline: float, latencies: List[float]):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get(args.probe_path)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(args.probe_interval)
+
+
+async def run(args, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        login_latencies, probe_latencies, statuses = [], [], {}
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(
+            probe_worker(client, args, deadline, probe_latencies),
+            *(login_worker(client, args, deadline, login_latencies, statuses) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "logins_per_second": statuses.get(200, 0) / elapsed,
+        "statuses": statuses,
+        "login_p50_ms": percentile(login_latencies, 0.5) * 1000,
+        "login_p99_ms": percentile(login_latencies, 0.99) * 1000,
+        "probe_p50_ms": percentile(probe_latencies, 0.5) * 1000,
+        "probe_p99_ms": percentile(probe_latencies, 0.99) * 1000,
+        "probe_mean_ms": statistics.fmean(probe_latencies) * 1000 if probe_latencies else float("nan"),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Пропускна здатність входів і затримки інших ендпоінтів під час шторму входів")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[0, 10, 50],
+                        help="Кількість паралельних клієнтів входу; 0 — базова лінія без входів")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--probe-path", default="/api/analytics/statistics/metrics")
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        result = await run(args, concurrency)
+        print(" ".join(f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                       for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
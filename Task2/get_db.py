@@ -1,37 +1,36 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy_utils import database_exists, create_database
 
 import Constants
 
 DATABASE_URL = f"postgresql://{Constants.PG_USER}:{Constants.PG_PASSWORD}@" \
                f"{Constants.PG_SERVER}/{Constants.PG_DB}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{Constants.PG_USER}:{Constants.PG_PASSWORD}@" \
+                     f"{Constants.PG_SERVER}/{Constants.PG_DB}"
 
-engine = create_engine(DATABASE_URL)
+if not database_exists(DATABASE_URL):
+    create_database(DATABASE_URL)
 
-if not database_exists(engine.url):
-    create_database(engine.url)
+engine = create_async_engine(ASYNC_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 
-def initialize_db():
-    Base.metadata.create_all(bind=engine)
+async def initialize_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
 
 
-def close_connection():
-    engine.dispose()
+async def close_connection():
+    await engine.dispose()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 __all__ = ["get_db"]
@@ -2,9 +2,14 @@ from fastapi import FastAPI, APIRouter, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from get_db import initialize_db, close_connection
+from Constants import INGEST_MODE, INGEST_SHUTDOWN_TIMEOUT_SECONDS
+from services import measurement_service, partition_service, config_events, config_service, user_service, \
+    rollup_service
+from services.password_hasher import password_hasher
 from routers.administration_router import administration_router
 from routers.analytics_router import analytics_router
 from routers.auth_router import auth_router
+from routers.measurement_router import measurement_router
 import sys
 import logging
 from logger import logger
@@ -25,21 +30,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 async def startup():
     logger.info("Запуск додатку")
-    initialize_db()
+    await initialize_db()
+    await partition_service.prepare()
+    await rollup_service.prepare()
+    await config_service.prepare()
+    await user_service.prepare()
+    partition_service.start_maintenance()
+    config_events.start(config_service.load_configs)
+    if INGEST_MODE == "buffered":
+        await measurement_service.measurement_buffer.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
     logger.info("Завершення роботи додатку")
+    await measurement_service.measurement_buffer.stop(INGEST_SHUTDOWN_TIMEOUT_SECONDS)
+    await partition_service.stop_maintenance()
+    await config_events.stop()
+    password_hasher.shutdown()
     await close_connection()
 
 
 api.include_router(administration_router)
 api.include_router(analytics_router)
 api.include_router(auth_router)
+api.include_router(measurement_router)
 app.include_router(api)
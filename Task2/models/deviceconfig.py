@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, JSON, ForeignKey, String
+from sqlalchemy import Column, Integer, JSON, ForeignKey, String, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from get_db import Base
@@ -6,6 +6,8 @@ from get_db import Base
 
 class DeviceConfig(Base):
     __tablename__ = "device_configs"
+    # Одна конфігурація на пристрій; потрібне для INSERT ... ON CONFLICT (device_id)
+    __table_args__ = (UniqueConstraint("device_id", name="uq_device_configs_device_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
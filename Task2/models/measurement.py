@@ -1,15 +1,26 @@
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Float, DateTime, ForeignKey, Index, Sequence
 from sqlalchemy.orm import relationship
 
 from get_db import Base
 
+# Послідовність спільна для всіх секцій; серверне значення за замовчуванням потрібне для COPY
+measurement_id_seq = Sequence("measurements_id_seq", metadata=Base.metadata)
+
 
 class Measurement(Base):
     __tablename__ = "measurements"
+    # Таблиця секціонується помісячно за timestamp (services/partition_service.py), тому timestamp
+    # входить до первинного ключа; індекси PostgreSQL створює в кожній секції. id в кінці індексів
+    # дає повний порядок для keyset-пагінації за (timestamp, id)
+    __table_args__ = (
+        Index("ix_measurements_device_id_timestamp_id", "device_id", "timestamp", "id"),
+        Index("ix_measurements_timestamp_id", "timestamp", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(BigInteger, measurement_id_seq, server_default=measurement_id_seq.next_value(), primary_key=True)
     device_id = Column(Integer, ForeignKey("devices.id"))
-    timestamp = Column(DateTime)
+    timestamp = Column(DateTime, primary_key=True)
     temperature = Column(Float)
     humidity = Column(Float)
     co2 = Column(Float)
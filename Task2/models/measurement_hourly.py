@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, DateTime, ForeignKey
+
+from get_db import Base
+
+
+class MeasurementHourly(Base):
+    # Для кожної метрики — кількість, середнє та суми центральних степенів відхилень (m2..m4):
+    # сирі Σx³, Σx⁴ для значень масштабу CO2 втрачають точність при відніманні
+    __tablename__ = "measurement_hourly"
+
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    row_count = Column(BigInteger, nullable=False, default=0)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+
+    temperature_count = Column(BigInteger, nullable=False, default=0)
+    temperature_mean = Column(Float, nullable=False, default=0)
+    temperature_m2 = Column(Float, nullable=False, default=0)
+    temperature_m3 = Column(Float, nullable=False, default=0)
+    temperature_m4 = Column(Float, nullable=False, default=0)
+    temperature_min = Column(Float)
+    temperature_max = Column(Float)
+
+    humidity_count = Column(BigInteger, nullable=False, default=0)
+    humidity_mean = Column(Float, nullable=False, default=0)
+    humidity_m2 = Column(Float, nullable=False, default=0)
+    humidity_m3 = Column(Float, nullable=False, default=0)
+    humidity_m4 = Column(Float, nullable=False, default=0)
+    humidity_min = Column(Float)
+    humidity_max = Column(Float)
+
+    co2_count = Column(BigInteger, nullable=False, default=0)
+    co2_mean = Column(Float, nullable=False, default=0)
+    co2_m2 = Column(Float, nullable=False, default=0)
+    co2_m3 = Column(Float, nullable=False, default=0)
+    co2_m4 = Column(Float, nullable=False, default=0)
+    co2_min = Column(Float)
+    co2_max = Column(Float)
+
+    productivity_count = Column(BigInteger, nullable=False, default=0)
+    productivity_mean = Column(Float, nullable=False, default=0)
+    productivity_m2 = Column(Float, nullable=False, default=0)
+    productivity_m3 = Column(Float, nullable=False, default=0)
+    productivity_m4 = Column(Float, nullable=False, default=0)
+    productivity_min = Column(Float)
+    productivity_max = Column(Float)
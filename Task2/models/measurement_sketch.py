@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
+
+from get_db import Base
+
+
+class MeasurementHourlySketch(Base):
+    __tablename__ = "measurement_hourly_sketch"
+
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    temperature = Column(JSONB, nullable=False, default=dict)
+    humidity = Column(JSONB, nullable=False, default=dict)
+    co2 = Column(JSONB, nullable=False, default=dict)
+    productivity = Column(JSONB, nullable=False, default=dict)
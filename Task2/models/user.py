@@ -11,3 +11,5 @@ class User(Base):
     password_hash = Column(String)
     role = Column(Enum('manager', 'admin', name='user_role'))
     is_banned = Column(Boolean, default=False)
+    # Збільшується при блокуванні, зміні ролі чи пароля; токени зі старою версією недійсні
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
@@ -4,16 +4,18 @@ from datetime import datetime
 from typing import List, Optional, Union, Dict
 
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Body, Header, Request
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 
 from pydantic import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from Constants import DEVICE_MEASUREMENTS_PAGE_SIZE, DEVICE_MEASUREMENTS_PAGE_LIMIT
 from get_db import get_db
 from models.esp import Device
 from models.room import Room
-from services import room_service, device_service, config_service, user_service
+from services import room_service, device_service, config_service, user_service, export_service, \
+    import_service
 from sсhemas.config import ConfigUpdate
 from sсhemas.device import DeviceCreate
 from sсhemas.room import RoomCreate
@@ -25,10 +27,10 @@ from sсhemas.room import RoomRead
 from sсhemas.device import DeviceRead
 
 from logger import logger
+from time_utils import to_naive_utc
 
-from models.user import User
 
-from auth import get_current_manager_or_admin, get_current_admin
+from auth import AuthUser, get_current_manager_or_admin, get_current_admin
 
 from sсhemas.user import UserRead, ChangeRoleInput
 
@@ -36,12 +38,12 @@ administration_router = APIRouter(tags=["admin"], prefix="/admin")
 
 
 @administration_router.post("/rooms", response_model=RoomRead)
-def create_room(
+async def create_room(
         room: RoomCreate,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)):
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)):
     try:
-        new_room = room_service.create_room(db, room)
+        new_room = await room_service.create_room(db, room)
         return RoomRead(
             id=new_room.id,
             name=new_room.name,
@@ -54,88 +56,105 @@ def create_room(
 
 
 @administration_router.delete("/rooms/{room_id}")
-def delete_room(
+async def delete_room(
         room_id: int,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)):
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)):
     try:
-        room_service.delete_room(db, room_id)
+        await room_service.delete_room(db, room_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     return {"message": "Кімната видалена успішно"}
 
 
 @administration_router.post("/devices")
-def create_device(device: DeviceCreate,
-                  db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_admin)):
+async def create_device(device: DeviceCreate,
+                  db: AsyncSession = Depends(get_db),
+                  current_user: AuthUser = Depends(get_current_admin)):
     try:
-        device_service.create_device(db, device)
+        await device_service.create_device(db, device)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Пристрій створений успішно"}
 
 
 @administration_router.delete("/devices/{mac_address}")
-def delete_device(mac_address: str,
-                  db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_admin)):
+async def delete_device(mac_address: str,
+                  db: AsyncSession = Depends(get_db),
+                  current_user: AuthUser = Depends(get_current_admin)):
     try:
-        device_service.delete_device_by_mac(db, mac_address)
+        await device_service.delete_device_by_mac(db, mac_address)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     return {"message": "Пристрій видалений успішно"}
 
 
-@administration_router.get("/devices/{mac_address}")
-def get_device(
+@administration_router.get("/devices/{mac_address}", response_model=DeviceRead)
+async def get_device(
         mac_address: str,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)):
+        include_measurements: bool = Query(False, description="Додати сторінку історії вимірювань"),
+        measurements_limit: int = Query(DEVICE_MEASUREMENTS_PAGE_SIZE, ge=1, le=DEVICE_MEASUREMENTS_PAGE_LIMIT),
+        measurements_cursor: Optional[str] = Query(None, description="Токен наступної сторінки вимірювань"),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)):
+    if measurements_cursor:
+        try:
+            export_service.decode_cursor(measurements_cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        return device_service.get_device_by_mac(db, mac_address)
+        return await device_service.get_device_by_mac(
+            db, mac_address, include_measurements, measurements_limit, measurements_cursor)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @administration_router.get("/devices", response_model=List[DeviceRead])
-def get_all_devices(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_manager_or_admin)
+async def get_all_devices(
+        include_measurements: bool = Query(False, description="Додати останні вимірювання кожного пристрою"),
+        measurements_limit: int = Query(DEVICE_MEASUREMENTS_PAGE_SIZE, ge=1, le=DEVICE_MEASUREMENTS_PAGE_LIMIT),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
 ):
     try:
-        return device_service.get_all_devices(db)
+        return await device_service.get_all_devices(db, include_measurements, measurements_limit)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @administration_router.get("/rooms", response_model=List[RoomRead])
-def get_all_rooms(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_manager_or_admin)
+async def get_all_rooms(
+        include_measurements: bool = Query(False, description="Додати останні вимірювання кожного пристрою"),
+        measurements_limit: int = Query(DEVICE_MEASUREMENTS_PAGE_SIZE, ge=1, le=DEVICE_MEASUREMENTS_PAGE_LIMIT),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
 ):
-    return room_service.get_all_rooms(db)
+    return await room_service.get_all_rooms(db, include_measurements, measurements_limit)
 
 
 @administration_router.get("/rooms/{room_id}/devices", response_model=List[DeviceRead])
-def get_room_devices(
+async def get_room_devices(
         room_id: int,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_manager_or_admin)):
-    return room_service.get_room_devices(db, room_id)
+        include_measurements: bool = Query(False, description="Додати останні вимірювання кожного пристрою"),
+        measurements_limit: int = Query(DEVICE_MEASUREMENTS_PAGE_SIZE, ge=1, le=DEVICE_MEASUREMENTS_PAGE_LIMIT),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)):
+    return await room_service.get_room_devices(db, room_id, include_measurements, measurements_limit)
 
 
 @administration_router.post("/config/import")
 async def import_config(
         file: UploadFile = File(...),
         device_id: Optional[int] = Query(None, description="ID пристрою для імпорту конфігурації"),
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_manager_or_admin)
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
 ):
-    content = await file.read()
     try:
-        data = json.loads(content)
-        result = config_service.import_config(db, data, device_id)
+        if device_id is None:
+            report = await config_service.import_configs(db, file.file)
+            return {"message": f"Успішно імпортовано {report['imported']} конфігурацій", **report}
+        data = json.load(file.file)
+        result = await config_service.import_config(db, data, device_id)
         return {"message": f"Успішно імпортовано {result} конфігурацій"}
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Некоректний формат JSON")
@@ -146,12 +165,12 @@ async def import_config(
 
 
 @administration_router.get("/config/export")
-def export_config(
-        db: Session = Depends(get_db),
+async def export_config(
+        db: AsyncSession = Depends(get_db),
         device_id: Optional[int] = Query(None, description="ID пристрою для експорту конфігурації"),
-        current_user: User = Depends(get_current_manager_or_admin)
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
 ):
-    config_data = config_service.export_config(db, device_id)
+    config_data = await config_service.export_config(db, device_id)
     if not config_data:
         raise HTTPException(status_code=404, detail="Конфігурацію не знайдено")
 
@@ -170,42 +189,68 @@ def export_config(
 @administration_router.get("/device/config")
 async def export_device_config(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     mac_address = request.headers.get("mac_address")
     if not mac_address:
         raise HTTPException(status_code=400, detail="MAC-адреса не вказана в заголовку")
 
-    device = device_service.get_device_by_mac(db, mac_address)
-    if not device:
+    # Пристрій і конфігурація беруться з кешів у пам'яті, тож повторне опитування з If-None-Match
+    # відповідає 304 без звернення до бази даних
+    try:
+        device = await device_service.resolve_device(db, mac_address)
+    except ValueError:
         raise HTTPException(status_code=404, detail="Пристрій з вказаним MAC-адресом не знайдено")
-
     try:
-        config_data = config_service.export_config(db, device.id)
-        if not config_data:
-            raise HTTPException(status_code=404, detail="Конфігурацію не знайдено")
+        entry = await config_service.get_cached_config(db, device.id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Конфігурацію не знайдено")
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"config_device_{device.id}_{timestamp}.json"
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if config_service.etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
 
-        return Response(
-            content=json.dumps(config_data, cls=CustomJSONEncoder, indent=2, ensure_ascii=False),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-    except Exception as e:
+    try:
+        content = config_service.config_export_body(device.id, entry.data)
+    except Exception:
         raise HTTPException(status_code=500, detail="Помилка при експорті конфігурації пристрою")
 
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    headers["Content-Disposition"] = f"attachment; filename=config_device_{device.id}_{timestamp}.json"
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+@administration_router.get("/device/config/stream")
+async def stream_device_config(
+        request: Request,
+        mac_address: Optional[str] = Query(None, description="MAC-адреса, якщо не передана в заголовку"),
+        db: AsyncSession = Depends(get_db)
+):
+    mac_address = request.headers.get("mac_address") or mac_address
+    if not mac_address:
+        raise HTTPException(status_code=400, detail="MAC-адреса не вказана в заголовку")
+    try:
+        device = await device_service.resolve_device(db, mac_address)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Пристрій з вказаним MAC-адресом не знайдено")
+
+    # Last-Event-ID — ETag останньої отриманої конфігурації; з ним потік продовжується без повторної відправки
+    return StreamingResponse(
+        config_service.stream_config(device.id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @administration_router.put("/config/{device_id}")
-def update_config_parameter(
+async def update_config_parameter(
         device_id: int,
         config_update: ConfigUpdate,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_manager_or_admin)
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
 ):
     try:
-        updated_config = config_service.update_config_parameter(db, device_id, config_update)
+        updated_config = await config_service.update_config_parameter(db, device_id, config_update)
         logger.info(f"Configuration updated successfully for device {device_id}")
         return {"message": "Конфігурацію успішно оновлено", "updated_config": updated_config}
     except ValidationError as e:
@@ -225,45 +270,89 @@ def update_config_parameter(
 
 
 @administration_router.get("/measurements/export")
-def export_measurements(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_manager_or_admin)
+async def export_measurements(
+        format: str = Query("json", pattern="^(json|ndjson|csv|arrow|parquet)$", description="Формат експорту"),
+        device_id: Optional[int] = Query(None, description="ID пристрою"),
+        room_id: Optional[int] = Query(None, description="ID кімнати"),
+        time_from: Optional[datetime] = Query(None, description="Початок часового діапазону"),
+        time_to: Optional[datetime] = Query(None, description="Кінець часового діапазону"),
+        cursor: Optional[str] = Query(None, description="Токен продовження: base64url від '<timestamp>|<id>' "
+                                                        "останнього отриманого вимірювання"),
+        limit: Optional[int] = Query(None, ge=1, description="Максимальна кількість вимірювань; якщо після них "
+                                                             "є ще дані, токен продовження повертається в X-Next-Cursor"),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
+):
+    time_from, time_to = to_naive_utc(time_from), to_naive_utc(time_to)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    headers = {"Content-Disposition": f"attachment; filename=measurements_{timestamp}.{format}"}
+    try:
+        query = export_service.measurements_query(device_id, room_id, time_from, time_to, cursor, limit)
+        if format in export_service.COLUMNAR_FORMATS:
+            export_service.require_pyarrow()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Заголовки йдуть до тіла, тож межа сторінки визначається до початку потоку
+    if limit:
+        page_end = await export_service.page_end(db, query, limit)
+        if page_end is not None:
+            query = export_service.measurements_query(device_id, room_id, time_from, time_to, cursor, until=page_end)
+            headers["X-Next-Cursor"] = export_service.encode_cursor(*page_end)
+
+    return StreamingResponse(
+        export_service.stream_measurements(query, format),
+        media_type=export_service.MEDIA_TYPES[format],
+        headers=headers
+    )
+
+
+@administration_router.post("/measurements/import")
+async def import_measurements(
+        file: UploadFile = File(...),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_manager_or_admin)
 ):
-    measurements = device_service.export_measurements(db)
-    return measurements
+    try:
+        file_format = import_service.detect_format(file.filename)
+        return await import_service.import_measurements(db, file.file, file_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Внутрішня помилка сервера: {str(e)}")
 
 
 @administration_router.post("/ban/{username}")
-def ban_user(
+async def ban_user(
         username: str,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)):
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)):
     try:
-        user_service.ban_user(db, username)
+        await user_service.ban_user(db, username)
         return {"message": f"Користувач {username} заблокований"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @administration_router.post("/unban/{username}")
-def unban_user(
+async def unban_user(
         username: str,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)):
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)):
     try:
-        user_service.unban_user(db, username)
+        await user_service.unban_user(db, username)
         return {"message": f"Користувач {username} розблокований"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @administration_router.post("/change_role")
-def change_role(
+async def change_role(
         change_data: ChangeRoleInput,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)):
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)):
     try:
-        user_service.change_role(db, change_data.username, change_data.role)
+        await user_service.change_role(db, change_data.username, change_data.role)
         return {"message": f"Роль користувача {change_data.username} змінена на {change_data.role}"}
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=str(e.detail))
@@ -272,8 +361,8 @@ def change_role(
 
 
 @administration_router.get("/users", response_model=List[UserRead])
-def get_users(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_admin)
+async def get_users(
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_admin)
 ):
-    return user_service.get_all_users(db)
+    return await user_service.get_all_users(db)
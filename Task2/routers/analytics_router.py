@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 
-from services import analytics_service, device_service
-from sqlalchemy.orm import Session
-from starlette.responses import FileResponse
+from services import analytics_service, device_service, statistics_cache, surface_service
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import FileResponse, Response
 
-from sсhemas.analytics import StatisticsInput, PredictionInput, StatisticsResponse, RoomStatisticsInput
+from sсhemas.analytics import StatisticsInput, PredictionInput, StatisticsResponse, RoomStatisticsInput, \
+    PredictionBatchInput, PredictionBatchResponse, SurfaceInput, SurfaceResponse
 
 from get_db import get_db
 
@@ -14,42 +15,81 @@ analytics_router = APIRouter(tags=["analytics"], prefix="/analytics")
 
 
 @analytics_router.post("/predict")
-def predict_productivity(input_data: PredictionInput, db: Session = Depends(get_db)):
+async def predict_productivity(
+        input_data: PredictionInput,
+        durable: bool = Query(False, description="Дочекатися запису вимірювання в базу даних"),
+        db: AsyncSession = Depends(get_db)):
     try:
-        device = device_service.get_device_by_mac(db, input_data.mac_address)
-        if not device:
-            raise HTTPException(status_code=404, detail=f"Пристрій з MAC-адресом {input_data.mac_address} не знайдено")
+        device = await device_service.resolve_device(db, input_data.mac_address)
 
-        prediction, recommendations = analytics_service.calculate_prediction(
-            db, device.id, input_data.Temperature, input_data.Humidity, input_data.CO2
+        prediction, recommendations = await analytics_service.calculate_prediction(
+            db, device.id, input_data.Temperature, input_data.Humidity, input_data.CO2, durable
         )
         return {"prediction": prediction, "recommendations": recommendations}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@analytics_router.post("/predict/batch", response_model=PredictionBatchResponse)
+async def predict_productivity_batch(
+        input_data: PredictionBatchInput,
+        durable: bool = Query(False, description="Дочекатися запису вимірювань в базу даних"),
+        db: AsyncSession = Depends(get_db)):
+    try:
+        results, stored = await analytics_service.calculate_prediction_batch(db, input_data.readings, durable)
+        return PredictionBatchResponse(results=results, stored=stored)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@analytics_router.post("/productivity/surface", response_model=SurfaceResponse)
+async def get_productivity_surface(
+        input_data: SurfaceInput,
+        db: AsyncSession = Depends(get_db)):
+    # Модель продуктивності на сітці уставок без запису вимірювань
+    try:
+        return await surface_service.get_surface(db, input_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @analytics_router.post("/statistics/all", response_model=StatisticsResponse)
-async def get_all_statistics(input_data: StatisticsInput, db: Session = Depends(get_db)):
+async def get_all_statistics(input_data: StatisticsInput):
     try:
-        statistics = analytics_service.get_statistics(db, input_data.time_from, input_data.time_to)
-        return StatisticsResponse(statistics=statistics)
+        body = await analytics_service.get_statistics_json(
+            input_data.time_from, input_data.time_to, aggregation=input_data.aggregation,
+            quantiles=input_data.quantiles, granularity=input_data.granularity, max_points=input_data.max_points)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @analytics_router.post("/statistics/room", response_model=StatisticsResponse)
-async def get_room_statistics(input_data: RoomStatisticsInput, db: Session = Depends(get_db)):
+async def get_room_statistics(input_data: RoomStatisticsInput):
     try:
-        statistics = analytics_service.get_statistics(db, input_data.time_from, input_data.time_to, input_data.room_id)
-        return StatisticsResponse(statistics=statistics)
+        body = await analytics_service.get_statistics_json(
+            input_data.time_from, input_data.time_to, input_data.room_id, aggregation=input_data.aggregation,
+            quantiles=input_data.quantiles, granularity=input_data.granularity, max_points=input_data.max_points)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@analytics_router.get("/statistics/metrics")
+async def get_statistics_metrics():
+    return {
+        "single_flight": analytics_service.statistics_flight.counters,
+        "cache": statistics_cache.info()
+    }
+
+
 @analytics_router.post("/record_environment")
-def record_environment(input_data: EnvironmentDataInput, db: Session = Depends(get_db)):
+async def record_environment(
+        input_data: EnvironmentDataInput,
+        durable: bool = Query(False, description="Дочекатися запису вимірювання в базу даних"),
+        db: AsyncSession = Depends(get_db)):
     try:
-        response = analytics_service.record_environment_data(db, input_data)
+        response = await analytics_service.record_environment_data(db, input_data, durable)
         return response
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth import AuthUser, get_current_active_user
+from Constants import MEASUREMENTS_PAGE_SIZE, MEASUREMENTS_PAGE_LIMIT
+from get_db import get_db
+from services import measurement_query_service
+from sсhemas.measurement import MeasurementPage
+from time_utils import to_naive_utc
+
+measurement_router = APIRouter(tags=["measurements"], prefix="/measurements")
+
+
+@measurement_router.get("", response_model=MeasurementPage)
+async def get_measurements(
+        device_id: Optional[int] = Query(None, description="ID пристрою"),
+        mac_address: Optional[str] = Query(None, description="MAC-адреса пристрою"),
+        room_id: Optional[int] = Query(None, description="ID кімнати"),
+        time_from: Optional[datetime] = Query(None, description="Початок часового діапазону"),
+        time_to: Optional[datetime] = Query(None, description="Кінець часового діапазону"),
+        filters: List[str] = Query([], alias="filter", description="Порогові фільтри, наприклад co2>1200 або temperature<=26"),
+        order: str = Query("asc", pattern="^(asc|desc)$", description="Порядок за часом"),
+        limit: int = Query(MEASUREMENTS_PAGE_SIZE, ge=1, le=MEASUREMENTS_PAGE_LIMIT,
+                           description="Розмір сторінки"),
+        cursor: Optional[str] = Query(None, description="Токен наступної сторінки з попередньої відповіді"),
+        db: AsyncSession = Depends(get_db),
+        current_user: AuthUser = Depends(get_current_active_user)
+):
+    try:
+        return await measurement_query_service.get_measurements_page(
+            db, limit, device_id, mac_address, room_id, to_naive_utc(time_from), to_naive_utc(time_to), filters, cursor,
+            order == "desc"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
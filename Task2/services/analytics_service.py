@@ -1,216 +1,254 @@
-import math
 from datetime import datetime
 from typing import List, Tuple, Dict, Optional
 
-import numpy as np
 import pandas as pd
-from models.deviceconfig import DeviceConfig
+from fastapi.concurrency import run_in_threadpool
+from get_db import SessionLocal
 from models.esp import Device
 from models.measurement import Measurement
-from sqlalchemy.orm import Session
-from sсhemas.analytics import StatisticsOutput
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from services import measurement_service, device_service, config_service, sql_statistics_service, rollup_service, \
+    stream_statistics_service, statistics_cache, room_service
+from services.productivity import ProductivityEvaluator
+from services.single_flight import SingleFlight
+from services.stats_math import METRICS, build_parameter_stats, trend_stats
+from sсhemas.analytics import StatisticsOutput, StatisticsResponse, BatchReading
 from sсhemas.measurement import EnvironmentDataInput
 
 
-def get_device_config(db: Session, device_id: int) -> Dict:
-    device_config = db.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).first()
-    if not device_config:
+async def get_device_evaluator(db: AsyncSession, device_id: int) -> ProductivityEvaluator:
+    try:
+        return (await config_service.get_cached_config(db, device_id)).evaluator
+    except ValueError:
         raise ValueError(f"Конфігурацію для пристрою з id {device_id} не знайдено")
-    return device_config.config_data
-
-
-def calculate_adjustment_factor(current_val, min_val, max_val, ideal_val, key):
-    if current_val < min_val or current_val > max_val:
-        return 0
-    else:
-        return 1
-
-
-def adjust_model_config(scores, config, temperature, humidity, co2):
-    adjustment_factors = {
-        'Temperature': calculate_adjustment_factor(temperature, config['min_values']['Temperature'],
-                                                   config['max_values']['Temperature'],
-                                                   config['ideal_values']['Temperature'], 'Temperature'),
-        'Humidity': calculate_adjustment_factor(humidity, config['min_values']['Humidity'],
-                                                config['max_values']['Humidity'], config['ideal_values']['Humidity'],
-                                                'Humidity'),
-        'CO2': calculate_adjustment_factor(co2, config['min_values']['CO2'], config['max_values']['CO2'],
-                                           config['ideal_values']['CO2'], 'CO2')
-    }
-
-    adjusted_scores = {
-        'Temperature': scores['Temperature'] * adjustment_factors['Temperature'],
-        'Humidity': scores['Humidity'] * adjustment_factors['Humidity'],
-        'CO2': scores['CO2'] * adjustment_factors['CO2']
-    }
-
-    return adjusted_scores
-
-
-def calculate_productivity(temperature, humidity, co2, config):
-    temperature_weight = 5
-    humidity_weight = 3
-    co2_weight = 1
-
-    temperature_score = math.exp(-((temperature - config['ideal_values']['Temperature']) ** 2) / 50)
-    humidity_score = math.exp(-((humidity - config['ideal_values']['Humidity']) ** 2) / 100)
-
-    co2_ideal = config['ideal_values']['CO2']
-    co2_max = config['max_values']['CO2']
-    if co2 <= co2_ideal:
-        co2_score = 1
-    else:
-        co2_score = 1 - math.log(1 + (co2 - co2_ideal) / (co2_max - co2_ideal)) / math.log(3)
 
-    scores = {
-        "Temperature": temperature_score,
-        "Humidity": humidity_score,
-        "CO2": co2_score
-    }
-
-    adjusted_scores = adjust_model_config(scores, config, temperature, humidity, co2)
 
-    overall_score = (
-                            adjusted_scores["Temperature"] ** temperature_weight *
-                            adjusted_scores["Humidity"] ** humidity_weight *
-                            adjusted_scores["CO2"] ** co2_weight
-                    ) ** (1 / (temperature_weight + humidity_weight + co2_weight)) * 100
+async def calculate_prediction(db: AsyncSession, device_id: int, temperature: float, humidity: float, co2: float,
+                               durable: bool = False) -> Tuple[float, List[str]]:
+    evaluator = await get_device_evaluator(db, device_id)
+    prediction = evaluator.score(temperature, humidity, co2)
 
-    return round(overall_score)
+    await measurement_service.store_measurements(db, [{
+        "device_id": device_id,
+        "timestamp": datetime.utcnow(),
+        "temperature": temperature,
+        "humidity": humidity,
+        "co2": co2,
+        "productivity": prediction
+    }], durable)
 
+    return prediction, build_recommendations(prediction, temperature, humidity, co2, evaluator)
 
-def calculate_prediction(db: Session, device_id: int, temperature: float, humidity: float, co2: float) -> Tuple[float, List[str]]:
-    config = get_device_config(db, device_id)
-    prediction = calculate_productivity(temperature, humidity, co2, config)
-
-    new_measurement = Measurement(
-        device_id=device_id,
-        timestamp=datetime.utcnow(),
-        temperature=temperature,
-        humidity=humidity,
-        co2=co2,
-        productivity=prediction
-    )
-    db.add(new_measurement)
-    db.commit()
 
+def build_recommendations(prediction: float, temperature: float, humidity: float, co2: float,
+                          evaluator: ProductivityEvaluator) -> List[str]:
     recommendations = []
-    if prediction < config.get('productivity_norm', 80):
+    if prediction < evaluator.productivity_norm:
         recommendations.append(f"Ваша продуктивність може бути занадто низькою, близько {prediction}%.")
 
-        temp_ideal = config['ideal_values']['Temperature']
+        temp_ideal = evaluator.temperature_ideal
         if abs(temperature - temp_ideal) > 2:
             direction = "підвищити" if temperature < temp_ideal else "знизити"
             recommendations.append(f"Рекомендується {direction} температуру ближче до {temp_ideal}°C.")
 
-        humidity_ideal = config['ideal_values']['Humidity']
+        humidity_ideal = evaluator.humidity_ideal
         if abs(humidity - humidity_ideal) > 10:
             direction = "підвищити" if humidity < humidity_ideal else "знизити"
             recommendations.append(f"Рекомендується {direction} вологість ближче до {humidity_ideal}%.")
 
-        co2_ideal = config['ideal_values']['CO2']
+        co2_ideal = evaluator.co2_ideal
         if co2 > co2_ideal + 100:
             recommendations.append(f"Рекомендується зменшити рівень CO2 ближче до {co2_ideal} ppm.")
 
-    return prediction, recommendations
+    return recommendations
+
+
+async def calculate_prediction_batch(db: AsyncSession, readings: List[BatchReading],
+                                     durable: bool = False) -> Tuple[List[Dict], int]:
+    resolved = await device_service.resolve_devices(db, (reading.mac_address for reading in readings))
+    devices = {mac_address: device.id for mac_address, device in resolved.items()}
+
+    evaluators = {device_id: entry.evaluator for device_id, entry in
+                  (await config_service.get_cached_configs(db, devices.values())).items()}
+
+    results: List[Optional[Dict]] = [None] * len(readings)
+    scored = []
+    for index, reading in enumerate(readings):
+        device_id = devices.get(reading.mac_address)
+        if device_id is None:
+            results[index] = {"mac_address": reading.mac_address,
+                              "error": f"Пристрій з MAC-адресом {reading.mac_address} не знайдено"}
+        elif device_id not in evaluators:
+            results[index] = {"mac_address": reading.mac_address,
+                              "error": f"Конфігурацію для пристрою з id {device_id} не знайдено"}
+        else:
+            scored.append(index)
+
+    if not scored:
+        return results, 0
+
+    row_evaluators = [evaluators[devices[readings[index].mac_address]] for index in scored]
+    predictions = ProductivityEvaluator.stack(row_evaluators).score_array(
+        [readings[index].Temperature for index in scored],
+        [readings[index].Humidity for index in scored],
+        [readings[index].CO2 for index in scored],
+    ).tolist()
+
+    now = datetime.utcnow()
+    rows = []
+    for index, evaluator, prediction in zip(scored, row_evaluators, predictions):
+        reading = readings[index]
+        rows.append({
+            "device_id": devices[reading.mac_address],
+            "timestamp": reading.timestamp or now,
+            "temperature": reading.Temperature,
+            "humidity": reading.Humidity,
+            "co2": reading.CO2,
+            "productivity": prediction
+        })
+        results[index] = {
+            "mac_address": reading.mac_address,
+            "prediction": prediction,
+            "recommendations": build_recommendations(
+                prediction, reading.Temperature, reading.Humidity, reading.CO2, evaluator)
+        }
 
+    stored = await measurement_service.store_measurements(db, rows, durable)
+    return results, stored
+
+
+async def record_environment_data(db: AsyncSession, input_data: EnvironmentDataInput, durable: bool = False):
+    await measurement_service.store_measurements(db, [{
+        "device_id": input_data.device_id,
+        "timestamp": datetime.utcnow(),
+        "temperature": input_data.Temperature,
+        "humidity": input_data.Humidity,
+        "co2": input_data.CO2
+    }], durable)
+    return {"message": "Дані успішно записано"}
+
+
+async def get_statistics(db: AsyncSession, time_from: datetime, time_to: datetime,
+                         room_id: Optional[int] = None, aggregation: str = "rollup",
+                         quantiles: str = "approx", granularity: str = "hour",
+                         max_points: Optional[int] = None) -> List[StatisticsOutput]:
+    if aggregation == "sql":
+        return await sql_statistics_service.get_statistics(db, time_from, time_to, room_id, granularity, max_points)
+    if aggregation == "rollup":
+        return await rollup_service.get_statistics(
+            db, time_from, time_to, room_id, quantiles, granularity, max_points)
+    if aggregation == "stream":
+        return await stream_statistics_service.get_statistics(
+            db, time_from, time_to, room_id, quantiles, granularity, max_points)
+
+    query = select(Measurement.__table__).where(Measurement.timestamp.between(time_from, time_to))
+    if room_id:
+        query = query.join(Device).where(Device.room_id == room_id)
 
-def clean_float(value):
-    if isinstance(value, (float, np.floating)):
-        if math.isnan(value) or math.isinf(value):
-            return None
-    return value
+    result = await db.execute(query)
+    columns = list(result.keys())
+    rows = result.all()
 
+    # Побудова DataFrame і розрахунки pandas виконуються в пулі потоків, щоб не блокувати цикл подій
+    return await run_in_threadpool(compute_statistics, rows, columns, granularity, max_points)
 
-def clean_dict(d):
-    return {k: clean_float(v) if isinstance(v, (float, np.floating)) else v for k, v in d.items()}
 
+# Однакові паралельні запити статистики, яких ще немає в кеші, рахуються один раз
+statistics_flight = SingleFlight()
 
-def get_statistics(db: Session, time_from: datetime, time_to: datetime, room_id: Optional[int] = None) -> List[
-    StatisticsOutput]:
-    query = db.query(Measurement).filter(Measurement.timestamp.between(time_from, time_to))
-    if room_id:
-        query = query.join(Device).filter(Device.room_id == room_id)
 
-    df = pd.read_sql(query.statement, db.bind)
+async def get_statistics_json(time_from: datetime, time_to: datetime, room_id: Optional[int] = None,
+                              aggregation: str = "rollup", quantiles: str = "approx", granularity: str = "hour",
+                              max_points: Optional[int] = None) -> bytes:
+    # Серіалізована відповідь /statistics через кеш результатів statistics_cache
+    key = statistics_cache.make_key(time_from, time_to, room_id, aggregation, quantiles, granularity, max_points)
+    body = statistics_cache.get(key)
+    if body is not None:
+        return body
+    return await statistics_flight.do(
+        key, lambda: _compute_statistics_json(
+            key, time_from, time_to, room_id, aggregation, quantiles, granularity, max_points)
+    )
 
-    if df.empty:
-        return []
 
-    device_stats = []
-    for device_id, device_df in df.groupby('device_id'):
-        try:
-            stats = {
-                'device_id': f'device_{device_id}',
-                'temperature': calculate_parameter_stats(device_df['temperature']),
-                'humidity': calculate_parameter_stats(device_df['humidity']),
-                'co2': calculate_parameter_stats(device_df['co2']),
-                'productivity': calculate_parameter_stats(device_df['productivity']),
-                'time_stats': calculate_time_stats(device_df)
-            }
-            device_stats.append(StatisticsOutput(**clean_dict(stats)))
-        except Exception as e:
-            print(f"Помилка при розрахунку статистики для девайсу з  {device_id}: {str(e)}")
-            continue
+async def _compute_statistics_json(key, time_from: datetime, time_to: datetime, room_id: Optional[int],
+                                   aggregation: str, quantiles: str, granularity: str,
+                                   max_points: Optional[int]) -> bytes:
+    # Власна сесія: обчислення може пережити запит, який його запустив
+    started_seq = statistics_cache.begin()
+    async with SessionLocal() as db:
+        statistics = await get_statistics(
+            db, time_from, time_to, room_id, aggregation, quantiles, granularity, max_points)
+        body = StatisticsResponse(statistics=statistics).model_dump_json().encode()
+        devices = await room_service.get_room_device_ids(db, room_id) if room_id else None
+    statistics_cache.put(key, body, time_from, time_to, devices, started_seq)
+    return body
 
-    return device_stats
 
+TREND_GROUPERS = {
+    "minute": {"freq": "min"},
+    "hour": {"freq": "h"},
+    "day": {"freq": "D"},
+    "week": {"freq": "W-MON", "label": "left", "closed": "left"},
+}
 
-def calculate_parameter_stats(series: pd.Series) -> Dict:
-    try:
-        return clean_dict({
-            'mean': series.mean(),
-            'median': series.median(),
-            'std': series.std(),
-            'min': series.min(),
-            'max': series.max(),
-            'quartiles': series.quantile([0.25, 0.5, 0.75]).tolist(),
-            'iqr': series.quantile(0.75) - series.quantile(0.25),
-            'skewness': series.skew(),
-            'kurtosis': series.kurtosis()
-        })
-    except Exception as e:
-        print(f"Помилка при розрахунку статистичних параметрів: {str(e)}")
-        return {}
 
+def compute_statistics(rows: List, columns: List[str], granularity: str = "hour",
+                       max_points: Optional[int] = None) -> List[StatisticsOutput]:
+    # Усі пристрої та метрики рахуються кількома згрупованими агрегаціями замість циклу по пристроях
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    df = df[df['device_id'].notna()]
 
-def calculate_time_stats(df: pd.DataFrame) -> Dict:
-    try:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.set_index('timestamp')
-        hourly_means = df.resample('h').mean()
-
-        hourly_trends = {
-            'temperature': hourly_means['temperature'].tolist(),
-            'humidity': hourly_means['humidity'].tolist(),
-            'co2': hourly_means['co2'].tolist(),
-            'productivity': hourly_means['productivity'].tolist() if 'productivity' in hourly_means.columns else None
-        }
+    if df.empty:
+        return []
 
-        return clean_dict({
-            'start_time': df.index.min().isoformat(),
-            'end_time': df.index.max().isoformat(),
-            'duration': (df.index.max() - df.index.min()).total_seconds() / 3600,
-            'hourly_trends': {k: [clean_float(v) for v in values] for k, values in hourly_trends.items() if
-                              values is not None}
-        })
-    except Exception as e:
-        print(f"Помилка при розрахунку даних часового ряду: {str(e)}")
-        return {}
+    metrics = list(METRICS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df[metrics] = df[metrics].apply(pd.to_numeric, errors='coerce').astype(float)
+
+    grouped = df.groupby('device_id')
+    summary = grouped[metrics].agg(['count', 'mean', 'std', 'min', 'max'])
+    quartiles = grouped[metrics].quantile([0.25, 0.5, 0.75]).unstack()
+    deviations = df[metrics] - grouped[metrics].transform('mean')
+    moments = {
+        power: (deviations ** power).groupby(df['device_id']).sum()
+        for power in (2, 3, 4)
+    }
+    times = grouped['timestamp'].agg(['min', 'max'])
+    buckets = df.groupby(['device_id', pd.Grouper(key='timestamp', **TREND_GROUPERS[granularity])])[metrics].mean()
+    buckets = buckets.astype(object).where(buckets.notna(), None)
+
+    summary_rows = summary.to_dict('index')
+    quartile_rows = quartiles.to_dict('index')
+    moment_rows = {power: frame.to_dict('index') for power, frame in moments.items()}
+    trends = {
+        device_id: trend_stats([
+            (start.to_pydatetime(), means)
+            for (_, start), means in device_buckets.to_dict('index').items()
+        ], granularity, max_points)
+        for device_id, device_buckets in buckets.groupby(level='device_id')
+    }
 
+    device_stats = []
+    for device_id, row in summary_rows.items():
+        stats = {
+            metric: build_parameter_stats(
+                row[(metric, 'count')], row[(metric, 'mean')], row[(metric, 'std')],
+                row[(metric, 'min')], row[(metric, 'max')],
+                [quartile_rows[device_id][(metric, q)] for q in (0.25, 0.5, 0.75)],
+                moment_rows[2][device_id][metric], moment_rows[3][device_id][metric],
+                moment_rows[4][device_id][metric]
+            )
+            for metric in metrics
+        }
+        start_time, end_time = times.at[device_id, 'min'], times.at[device_id, 'max']
+        stats['time_stats'] = {
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat(),
+            'duration': (end_time - start_time).total_seconds() / 3600,
+            **trends.get(device_id, {})
+        }
+        device_stats.append(StatisticsOutput(device_id=f'device_{device_id}', **stats))
 
-def record_environment_data(db: Session, input_data: EnvironmentDataInput):
-    try:
-        measurement = Measurement(
-            device_id=input_data.device_id,
-            timestamp=datetime.now(),
-            temperature=input_data.Temperature,
-            humidity=input_data.Humidity,
-            co2=input_data.CO2
-        )
-        db.add(measurement)
-        db.commit()
-        return {"message": "Дані успішно записано"}
-    except Exception as e:
-        db.rollback()
-        raise e
+    return device_stats
@@ -0,0 +1,68 @@
+import hashlib
+import itertools
+import json
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Optional
+
+from cache import TTLCache
+from Constants import CONFIG_CACHE_SIZE, CONFIG_CACHE_TTL_SECONDS
+from services.productivity import ProductivityEvaluator
+
+
+@dataclass(frozen=True)
+class CachedConfig:
+    version: int
+    data: Dict
+    etag: str
+
+    @cached_property
+    def evaluator(self) -> ProductivityEvaluator:
+        # Компілюється один раз на запис кешу, тобто при завантаженні або зміні конфігурації
+        return ProductivityEvaluator.from_config(self.data)
+
+
+_entries = TTLCache(CONFIG_CACHE_SIZE, CONFIG_CACHE_TTL_SECONDS)
+_versions: Dict[int, int] = {}
+_global_version = 0
+_counter = itertools.count(1)
+_lock = threading.Lock()
+
+
+def content_etag(data: Dict) -> str:
+    # Хеш вмісту, а не номер версії: однаковий у всіх воркерах і після перезапуску
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return '"' + hashlib.sha256(canonical.encode()).hexdigest()[:32] + '"'
+
+
+def current_version(device_id: int) -> int:
+    return max(_versions.get(device_id, 0), _global_version)
+
+
+def get(device_id: int) -> Optional[CachedConfig]:
+    entry = _entries.get(device_id)
+    if entry is not None and entry.version == current_version(device_id):
+        return entry
+    return None
+
+
+def put(device_id: int, data: Dict, version: int) -> CachedConfig:
+    # version береться до читання з БД: якщо конфігурацію змінили під час читання,
+    # застарілі дані повертаються викликачу, але в кеш не потрапляють
+    entry = CachedConfig(version=version, data=data, etag=content_etag(data))
+    with _lock:
+        if version == current_version(device_id):
+            _entries.set(device_id, entry)
+    return entry
+
+
+def invalidate(device_id: Optional[int] = None):
+    global _global_version
+    with _lock:
+        if device_id is None:
+            _global_version = next(_counter)
+            _entries.clear()
+        else:
+            _versions[device_id] = next(_counter)
+            _entries.pop(device_id)
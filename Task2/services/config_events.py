@@ -0,0 +1,145 @@
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from Constants import CONFIG_EVENTS_RECONNECT_SECONDS
+from get_db import DATABASE_URL
+from logger import logger
+from services import config_cache
+from services.config_cache import CachedConfig
+
+CHANNEL = "device_config"
+# Ідентифікатор воркера, щоб не обробляти власні повідомлення вдруге
+ORIGIN = uuid.uuid4().hex
+# Більші пакети оголошуються як зміна всіх конфігурацій: розмір повідомлення NOTIFY обмежений 8000 байт
+NOTIFY_MAX_DEVICES = 500
+
+# device_id -> черги підписаних потоків. Черга на одне повідомлення: кілька змін поспіль
+# зливаються, і потік отримує лише останню версію конфігурації (None — конфігурації немає)
+_subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+_listener_task: Optional[asyncio.Task] = None
+# Конфігурації для всіх розбуджених потоків перечитуються одним запитом в одній задачі,
+# а не кожним потоком окремо: інакше масове оновлення вичерпує пул з'єднань
+_loader: Optional[Callable[[List[int]], Awaitable[Dict[int, CachedConfig]]]] = None
+_pending: Set[int] = set()
+_reload_task: Optional[asyncio.Task] = None
+
+
+def subscribe(device_id: int) -> asyncio.Queue:
+    # Перша конфігурація приходить у чергу тим самим пакетним перечитуванням
+    queue = asyncio.Queue(maxsize=1)
+    _subscribers[device_id].add(queue)
+    dispatch([device_id])
+    return queue
+
+
+def unsubscribe(device_id: int, queue: asyncio.Queue):
+    queues = _subscribers.get(device_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[device_id]
+
+
+def dispatch(device_ids: Optional[Iterable[int]] = None):
+    global _reload_task
+    targets = list(_subscribers) if device_ids is None else device_ids
+    _pending.update(device_id for device_id in targets if device_id in _subscribers)
+    if _pending and _loader is not None and (_reload_task is None or _reload_task.done()):
+        _reload_task = asyncio.create_task(_reload())
+
+
+def _offer(queue: asyncio.Queue, entry: Optional[CachedConfig]):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(entry)
+
+
+async def _reload():
+    while _pending:
+        device_ids = [device_id for device_id in _pending if device_id in _subscribers]
+        _pending.clear()
+        try:
+            entries = await _loader(device_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Потоки лишаються відкритими; перечитування повторюється однією задачею
+            logger.error(f"Помилка перечитування конфігурацій для {len(device_ids)} потоків: {str(e)}")
+            _pending.update(device_ids)
+            await asyncio.sleep(CONFIG_EVENTS_RECONNECT_SECONDS)
+            continue
+        for device_id in device_ids:
+            for queue in _subscribers.get(device_id, ()):
+                _offer(queue, entries.get(device_id))
+
+
+async def notify(db: AsyncSession, device_ids: Iterable[int]):
+    # Викликається до commit: PostgreSQL доставляє повідомлення лише після фіксації транзакції
+    device_ids = sorted(set(device_ids))
+    payload = {"origin": ORIGIN, "devices": device_ids if len(device_ids) <= NOTIFY_MAX_DEVICES else None}
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                     {"channel": CHANNEL, "payload": json.dumps(payload)})
+
+
+def _on_notification(connection, pid, channel, payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get("origin") == ORIGIN:
+        return
+    device_ids = message.get("devices")
+    if device_ids is None:
+        config_cache.invalidate()
+    else:
+        for device_id in device_ids:
+            config_cache.invalidate(device_id)
+    dispatch(device_ids)
+
+
+async def _listen():
+    # Окреме з'єднання поза пулом SQLAlchemy, яке весь час слухає канал
+    while True:
+        try:
+            connection = await asyncpg.connect(DATABASE_URL)
+            try:
+                await connection.add_listener(CHANNEL, _on_notification)
+                # Поки з'єднання не було, повідомлення могли загубитися
+                config_cache.invalidate()
+                dispatch()
+                while not connection.is_closed():
+                    await asyncio.sleep(CONFIG_EVENTS_RECONNECT_SECONDS)
+            finally:
+                await connection.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Помилка підписки на зміни конфігурацій: {str(e)}")
+        await asyncio.sleep(CONFIG_EVENTS_RECONNECT_SECONDS)
+
+
+def start(loader: Callable[[List[int]], Awaitable[Dict[int, CachedConfig]]]):
+    global _listener_task, _loader
+    _loader = loader
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen())
+
+
+async def stop():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
+    if _reload_task is not None:
+        _reload_task.cancel()
@@ -1,28 +1,93 @@
+import asyncio
 import copy
-import traceback
-from typing import Optional, Dict, Any, List, Union
+import json
+from typing import Optional, Dict, Any, List, Union, AsyncIterator, BinaryIO, Iterator, Tuple
 
-from fastapi import UploadFile, HTTPException
-from sqlalchemy import inspect
+import ijson
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
-import json
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import iterate_in_threadpool
 
+from Constants import CONFIG_STREAM_HEARTBEAT_SECONDS, CONFIG_STREAM_RETRY_MS, CONFIG_IMPORT_CHUNK_SIZE
+from get_db import SessionLocal, engine
 from models.deviceconfig import DeviceConfig
+from models.esp import Device
+from services import config_cache, config_events
+from services.config_cache import CachedConfig
 from sqlalchemy.orm.attributes import flag_modified
 from sсhemas.config import ConfigUpdate
 from sсhemas.config import ConfigExport
 from sсhemas.config import ConfigImport
 from logger import logger
 
+UNIQUE_CONSTRAINT = "uq_device_configs_device_id"
+# Ключ advisory-блокування для міграції таблиці конфігурацій під час запуску кількох воркерів
+CONFIG_LOCK_KEY = 7310002
+
 
-def get_device_config(db: Session, device_id: int) -> DeviceConfig:
-    db_config = db.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).first()
+async def get_device_config(db: AsyncSession, device_id: int) -> DeviceConfig:
+    result = await db.execute(select(DeviceConfig).where(DeviceConfig.device_id == device_id))
+    db_config = result.scalars().first()
     if not db_config:
         raise ValueError(f"Конфігурацію для пристрою з ідентифікатором {device_id} не знайдено")
     return db_config
 
 
+async def get_cached_config(db: AsyncSession, device_id: int) -> CachedConfig:
+    entry = config_cache.get(device_id)
+    if entry is None:
+        version = config_cache.current_version(device_id)
+        entry = config_cache.put(device_id, (await get_device_config(db, device_id)).config_data, version)
+    return entry
+
+
+async def get_cached_configs(db: AsyncSession, device_ids) -> Dict[int, CachedConfig]:
+    entries = {}
+    missing = {}
+    for device_id in set(device_ids):
+        entry = config_cache.get(device_id)
+        if entry is None:
+            missing[device_id] = config_cache.current_version(device_id)
+        else:
+            entries[device_id] = entry
+
+    if missing:
+        result = await db.execute(
+            select(DeviceConfig).where(DeviceConfig.device_id.in_(missing.keys())).order_by(DeviceConfig.id)
+        )
+        db_configs = result.scalars().all()
+        for db_config in db_configs:
+            if db_config.device_id not in entries:
+                entries[db_config.device_id] = config_cache.put(
+                    db_config.device_id, db_config.config_data, missing[db_config.device_id])
+    return entries
+
+
+async def load_configs(device_ids: List[int]) -> Dict[int, CachedConfig]:
+    # Пакетне перечитування для потоків config_events; власна сесія, бо викликається поза запитом
+    async with SessionLocal() as db:
+        return await get_cached_configs(db, device_ids)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def config_export_body(device_id: int, config_data: Dict) -> bytes:
+    return ConfigExport(
+        device_id=device_id,
+        productivity_norm=config_data.get('productivity_norm'),
+        **{k: v for k, v in config_data.items() if k != 'productivity_norm'}
+    ).model_dump_json().encode()
+
+
 def update_config_data(config_data: dict, update_data: dict) -> dict:
     if config_data is None:
         config_data = {}
@@ -36,62 +101,125 @@ def update_config_data(config_data: dict, update_data: dict) -> dict:
     return config_data
 
 
-def save_config(db: Session, db_config: DeviceConfig):
+async def save_config(db: AsyncSession, db_config: DeviceConfig):
     flag_modified(db_config, "config_data")
     db.add(db_config)
     try:
-        db.commit()
-        db.refresh(db_config)
+        await config_events.notify(db, [db_config.device_id])
+        await db.commit()
+        await db.refresh(db_config)
     except SQLAlchemyError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Помилка бази даних при збереженні конфігурації")
 
 
 
-def import_config(db: Session, data: Dict[str, Any], device_id: Optional[int] = None) -> int:
-    if device_id is not None:
-        # Імпорт для конкретного пристрою
-        if not isinstance(data, dict):
-            raise ValueError("Для імпорту конфігурації конкретного пристрою дані повинні бути словником")
-        config = ConfigImport(**data)
-        db_config = db.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).first()
-        if db_config:
-            db_config.config_data = config.dict()
-        else:
-            db_config = DeviceConfig(device_id=device_id, config_data=config.dict())
-            db.add(db_config)
-        db.commit()
-        return 1
-    else:
-        # Імпорт всього файлу
-        if not isinstance(data, dict) or not all(isinstance(k, str) and k.isdigit() for k in data.keys()):
-            raise ValueError("Для імпорту всіх конфігурацій дані повинні бути словником з числовими ключами")
-        imported_count = 0
-        for dev_id, config_data in data.items():
-            config = ConfigImport(**config_data)
-            db_config = db.query(DeviceConfig).filter(DeviceConfig.device_id == int(dev_id)).first()
-            if db_config:
-                db_config.config_data = config.dict()
-            else:
-                db_config = DeviceConfig(device_id=int(dev_id), config_data=config.dict())
-                db.add(db_config)
-            imported_count += 1
-        db.commit()
-        return imported_count
-
-
-def export_config(db: Session, device_id: Optional[int] = None) -> Union[Dict[str, ConfigExport], ConfigExport]:
+async def _upsert_configs(db: AsyncSession, configs: Dict[int, Dict]):
+    # Один INSERT ... ON CONFLICT на весь пакет і коротка транзакція на кожен пакет
+    statement = insert(DeviceConfig).values(
+        [{"device_id": device_id, "config_data": config_data} for device_id, config_data in configs.items()]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[DeviceConfig.device_id], set_={"config_data": statement.excluded.config_data}
+    )
+    await db.execute(statement)
+    await config_events.notify(db, configs.keys())
+    await db.commit()
+    for device_id in configs:
+        config_cache.invalidate(device_id)
+    config_events.dispatch(configs.keys())
+
+
+async def import_config(db: AsyncSession, data: Dict[str, Any], device_id: int) -> int:
+    # Імпорт для конкретного пристрою
+    if not isinstance(data, dict):
+        raise ValueError("Для імпорту конфігурації конкретного пристрою дані повинні бути словником")
+    config = ConfigImport(**data)
+    await _upsert_configs(db, {device_id: config.dict()})
+    return 1
+
+
+def _read_config_chunks(file: BinaryIO) -> Iterator[List[Tuple[str, Any]]]:
+    chunk = []
+    for key, value in ijson.kvitems(file, "", use_float=True):
+        chunk.append((key, value))
+        if len(chunk) >= CONFIG_IMPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+async def import_configs(db: AsyncSession, file: BinaryIO) -> Dict[str, Any]:
+    # Імпорт всього файлу {device_id: конфігурація}: файл розбирається потоково в пулі потоків
+    # пакетами по CONFIG_IMPORT_CHUNK_SIZE, помилкові записи потрапляють у звіт і не зупиняють імпорт
+    report = {"imported": 0, "failed": 0, "errors": {}}
+    try:
+        async for chunk in iterate_in_threadpool(_read_config_chunks(file)):
+            configs = {}
+            for key, value in chunk:
+                if not key.isdigit():
+                    report["errors"][key] = "Ключ повинен бути числовим ID пристрою"
+                    continue
+                if not isinstance(value, dict):
+                    report["errors"][key] = "Конфігурація повинна бути словником"
+                    continue
+                try:
+                    configs[int(key)] = ConfigImport(**value).dict()
+                except ValidationError as e:
+                    report["errors"][key] = _validation_message(e)
+
+            known = set((await db.execute(select(Device.id).where(Device.id.in_(configs.keys())))).scalars().all())
+            for device_id in set(configs) - known:
+                report["errors"][str(device_id)] = f"Пристрій з ID {device_id} не знайдено"
+                del configs[device_id]
+            if configs:
+                await _upsert_configs(db, configs)
+                report["imported"] += len(configs)
+    except ijson.JSONError as e:
+        raise ValueError(f"Некоректний формат JSON (вже імпортовано {report['imported']} конфігурацій): {str(e)}")
+
+    report["failed"] = len(report["errors"])
+    return report
+
+
+async def prepare():
+    # Раніше на пристрій могло припадати кілька рядків; лишається найперший, який і читався,
+    # після чого додається обмеження унікальності для ON CONFLICT (device_id)
+    async with engine.begin() as connection:
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CONFIG_LOCK_KEY})
+        exists = (await connection.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": UNIQUE_CONSTRAINT}
+        )).scalar()
+        if exists:
+            return
+        removed = (await connection.execute(text(
+            "DELETE FROM device_configs c USING device_configs d WHERE c.device_id = d.device_id AND c.id > d.id"
+        ))).rowcount
+        if removed:
+            logger.warning(f"Видалено {removed} дублікатів конфігурацій пристроїв")
+        await connection.execute(text(
+            f"ALTER TABLE device_configs ADD CONSTRAINT {UNIQUE_CONSTRAINT} UNIQUE (device_id)"
+        ))
+
+
+async def export_config(db: AsyncSession, device_id: Optional[int] = None) -> Union[Dict[str, ConfigExport], ConfigExport]:
     if device_id:
-        config = db.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).first()
-        if not config:
+        try:
+            config_data = (await get_cached_config(db, device_id)).data
+        except ValueError:
             raise HTTPException(status_code=404, detail=f"Конфігурацію для пристрою з ID {device_id} не знайдено")
         return ConfigExport(
-            device_id=config.device_id,
-            productivity_norm=config.config_data.get('productivity_norm'),
-            **{k: v for k, v in config.config_data.items() if k != 'productivity_norm'}
+            device_id=device_id,
+            productivity_norm=config_data.get('productivity_norm'),
+            **{k: v for k, v in config_data.items() if k != 'productivity_norm'}
         )
     else:
-        configs = db.query(DeviceConfig).all()
+        configs = (await db.execute(select(DeviceConfig))).scalars().all()
         return {
             str(config.device_id): ConfigExport(
                 device_id=config.device_id,
@@ -102,16 +230,18 @@ def export_config(db: Session, device_id: Optional[int] = None) -> Union[Dict[st
         }
 
 
-def update_config_parameter(db: Session, device_id: int, config_update: ConfigUpdate):
+async def update_config_parameter(db: AsyncSession, device_id: int, config_update: ConfigUpdate):
     try:
-        db_config = get_device_config(db, device_id)
+        db_config = await get_device_config(db, device_id)
         original_config = copy.deepcopy(db_config.config_data)
         update_data = config_update.dict(exclude_unset=True, exclude_none=True)
 
         db_config.config_data = update_config_data(db_config.config_data, update_data)
 
         if db_config.config_data != original_config:
-            save_config(db, db_config)
+            await save_config(db, db_config)
+            config_cache.invalidate(device_id)
+            config_events.dispatch([device_id])
 
         return db_config.config_data
     except ValueError as ve:
@@ -119,4 +249,37 @@ def update_config_parameter(db: Session, device_id: int, config_update: ConfigUp
     except SQLAlchemyError:
         raise HTTPException(status_code=500, detail="Помилка бази даних при оновленні конфігурації")
     except Exception:
-        raise HTTPException(status_code=500, detail="Неочікувана помилка при оновленні конфігурації")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Неочікувана помилка при оновленні конфігурації")
+
+def _sse_event(event: str, event_id: str, data: str) -> bytes:
+    return f"event: {event}\nid: {event_id}\ndata: {data}\n\n".encode()
+
+
+async def stream_config(device_id: int, last_etag: Optional[str] = None) -> AsyncIterator[bytes]:
+    # Потік Server-Sent Events для пристрою: повна конфігурація, якщо її версія (ETag) відрізняється
+    # від last_etag, далі лише змінені секції. Конфігурації в чергу кладе config_events одним
+    # пакетним запитом на всі потоки, тож сам потік з'єднань з БД не тримає і не відкриває;
+    # поки змін немає, він лише періодично надсилає коментар-heartbeat
+    queue = config_events.subscribe(device_id)
+    try:
+        yield f"retry: {CONFIG_STREAM_RETRY_MS}\n\n".encode()
+        previous = None
+        while True:
+            try:
+                entry = await asyncio.wait_for(queue.get(), CONFIG_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            if entry is None:
+                continue
+            if entry.etag != last_etag:
+                # Дельта не може передати видалений ключ, тож у такому разі йде повна конфігурація
+                if previous is None or previous.keys() - entry.data.keys():
+                    yield _sse_event("config", entry.etag, config_export_body(device_id, entry.data).decode())
+                else:
+                    delta = {key: value for key, value in entry.data.items() if previous.get(key) != value}
+                    yield _sse_event("delta", entry.etag, json.dumps(delta, ensure_ascii=False))
+                last_etag = entry.etag
+            previous = entry.data
+    finally:
+        config_events.unsubscribe(device_id, queue)
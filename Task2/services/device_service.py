@@ -1,63 +1,206 @@
-import json
-from typing import List, Dict
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Iterable, Tuple
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
+from cache import TTLCache
+from Constants import DEVICE_CACHE_SIZE, DEVICE_CACHE_TTL_SECONDS, DEVICE_MEASUREMENTS_PAGE_SIZE
 from models.esp import Device
-from models.measurement import Measurement
-from sсhemas.device import DeviceCreate, DeviceRead
-
-
-def export_measurements(db: Session) -> List[Dict]:
-    measurements = db.query(Measurement).all()
-    measurement_data = []
-    for measurement in measurements:
-        measurement_data.append({
-            "id": measurement.id,
-            "device_id": measurement.device_id,
-            "timestamp": measurement.timestamp.isoformat(),
-            "temperature": measurement.temperature,
-            "humidity": measurement.humidity,
-            "co2": measurement.co2
-        })
-    return measurement_data
-
-
-def create_device(db: Session, device: DeviceCreate):
-    db_device = db.query(Device).filter(Device.mac_address == device.mac_address).first()
-    if db_device:
+from services import config_cache, statistics_cache
+from services.export_service import encode_cursor, decode_cursor
+from sсhemas.device import DeviceCreate, DeviceRead, ConfigRead, MeasurementRead, MeasurementSummary
+
+MEASUREMENT_FIELDS = "id, timestamp, temperature, humidity, co2, productivity"
+
+# Кількість береться з погодинних агрегатів, а не з count(*) по всій історії пристрою. Дані, записані
+# до появи measurement_hourly, треба один раз дозаповнити: python -m services.rollup_service.
+# Останнє вимірювання — одним зверненням до індексу (device_id, timestamp, id) кожної секції через LATERAL
+_SUMMARY_SQL = text(f"""
+SELECT d.id AS device_id,
+       (SELECT coalesce(sum(h.row_count), 0) FROM measurement_hourly h WHERE h.device_id = d.id) AS measurement_count,
+       m.*
+FROM unnest(CAST(:device_ids AS integer[])) AS d(id)
+LEFT JOIN LATERAL (
+    SELECT {MEASUREMENT_FIELDS} FROM measurements
+    WHERE device_id = d.id
+    ORDER BY timestamp DESC, id DESC
+    LIMIT 1
+) m ON true
+""")
+
+
+def _measurements_sql(with_cursor: bool):
+    cursor_condition = "AND (timestamp, id) < (:cursor_timestamp, :cursor_id)" if with_cursor else ""
+    return text(f"""
+SELECT d.id AS device_id, m.*
+FROM unnest(CAST(:device_ids AS integer[])) AS d(id)
+CROSS JOIN LATERAL (
+    SELECT {MEASUREMENT_FIELDS} FROM measurements
+    WHERE device_id = d.id {cursor_condition}
+    ORDER BY timestamp DESC, id DESC
+    LIMIT :limit
+) m
+""")
+
+
+@dataclass(frozen=True)
+class DeviceRef:
+    id: int
+    room_id: Optional[int] = None
+
+
+# MAC-адреса -> DeviceRef; використовується на шляху прийому вимірювань замість get_device_by_mac
+device_cache = TTLCache(DEVICE_CACHE_SIZE, DEVICE_CACHE_TTL_SECONDS)
+
+
+def invalidate_devices(mac_addresses: Iterable[str]):
+    for mac_address in mac_addresses:
+        device_cache.pop(mac_address)
+
+
+async def resolve_device(db: AsyncSession, mac_address: str) -> DeviceRef:
+    device = device_cache.get(mac_address)
+    if device is None:
+        result = await db.execute(select(Device.id, Device.room_id).where(Device.mac_address == mac_address))
+        row = result.first()
+        if not row:
+            raise ValueError(f"Пристрій з mac-адресою '{mac_address}' не знайдено")
+        device = DeviceRef(id=row.id, room_id=row.room_id)
+        device_cache.set(mac_address, device)
+    return device
+
+
+async def resolve_devices(db: AsyncSession, mac_addresses: Iterable[str]) -> Dict[str, DeviceRef]:
+    devices = {}
+    missing = set()
+    for mac_address in set(mac_addresses):
+        device = device_cache.get(mac_address)
+        if device is None:
+            missing.add(mac_address)
+        else:
+            devices[mac_address] = device
+
+    if missing:
+        result = await db.execute(
+            select(Device.mac_address, Device.id, Device.room_id).where(Device.mac_address.in_(missing))
+        )
+        for row in result:
+            device = DeviceRef(id=row.id, room_id=row.room_id)
+            device_cache.set(row.mac_address, device)
+            devices[row.mac_address] = device
+    return devices
+
+
+async def create_device(db: AsyncSession, device: DeviceCreate):
+    result = await db.execute(select(Device).where(Device.mac_address == device.mac_address))
+    if result.scalars().first():
         raise HTTPException(400, f"Пристрій з mac-адресою '{device.mac_address}' вже існує")
     new_device = Device(mac_address=device.mac_address)
     db.add(new_device)
-    db.commit()
-    db.refresh(new_device)
+    await db.commit()
+    await db.refresh(new_device)
+    invalidate_devices([device.mac_address])
 
 
-def delete_device_by_mac(db: Session, mac_address: str):
-    device = db.query(Device).filter(Device.mac_address == mac_address).first()
+async def delete_device_by_mac(db: AsyncSession, mac_address: str):
+    result = await db.execute(select(Device).where(Device.mac_address == mac_address))
+    device = result.scalars().first()
     if device:
-        db.delete(device)
-        db.commit()
+        device_id = device.id
+        await db.delete(device)
+        await db.commit()
+        invalidate_devices([mac_address])
+        config_cache.invalidate(device_id)
+        statistics_cache.invalidate()
     else:
         raise ValueError(f"Пристрій з mac-адресою '{mac_address}' не знайдено")
 
 
-def get_device_by_mac(db: Session, mac_address: str):
-    device = db.query(Device).filter(Device.mac_address == mac_address).options(
-        joinedload(Device.measurements),
-        joinedload(Device.configs)
-    ).first()
+def _measurement(row) -> MeasurementRead:
+    return MeasurementRead(id=row.id, timestamp=row.timestamp, temperature=row.temperature,
+                           humidity=row.humidity, co2=row.co2, productivity=row.productivity)
+
+
+async def get_measurement_summaries(db: AsyncSession, device_ids: List[int]) -> Dict[int, MeasurementSummary]:
+    if not device_ids:
+        return {}
+    result = await db.execute(_SUMMARY_SQL, {"device_ids": list(device_ids)})
+    return {
+        row.device_id: MeasurementSummary(
+            measurement_count=row.measurement_count,
+            last_timestamp=row.timestamp,
+            last_measurement=_measurement(row) if row.id is not None else None,
+        )
+        for row in result
+    }
+
+
+async def get_latest_measurements(db: AsyncSession, device_ids: List[int], limit: int,
+                                  cursor: Optional[str] = None) -> Dict[int, Tuple[List[MeasurementRead], Optional[str]]]:
+    # Сторінка від найновіших вимірювань; зайвий рядок показує, чи є наступна сторінка
+    if not device_ids:
+        return {}
+    params = {"device_ids": list(device_ids), "limit": limit + 1}
+    if cursor:
+        params["cursor_timestamp"], params["cursor_id"] = decode_cursor(cursor)
+    result = await db.execute(_measurements_sql(bool(cursor)), params)
+
+    rows: Dict[int, List] = {device_id: [] for device_id in device_ids}
+    for row in result:
+        rows[row.device_id].append(row)
+    pages = {}
+    for device_id, device_rows in rows.items():
+        page = device_rows[:limit]
+        next_cursor = encode_cursor(page[-1].timestamp, page[-1].id) if len(device_rows) > limit else None
+        pages[device_id] = ([_measurement(row) for row in page], next_cursor)
+    return pages
+
+
+async def build_device_reads(db: AsyncSession, devices: List[Device], include_measurements: bool = False,
+                             measurements_limit: int = DEVICE_MEASUREMENTS_PAGE_SIZE,
+                             measurements_cursor: Optional[str] = None) -> List[DeviceRead]:
+    # Пристрої мають бути завантажені з selectinload(Device.configs); історія вимірювань
+    # додається лише на запит
+    device_ids = [device.id for device in devices]
+    summaries = await get_measurement_summaries(db, device_ids)
+    pages = {}
+    if include_measurements:
+        pages = await get_latest_measurements(db, device_ids, measurements_limit, measurements_cursor)
+
+    reads = []
+    for device in devices:
+        measurements, next_cursor = pages.get(device.id, ([], None))
+        reads.append(DeviceRead(
+            id=device.id,
+            mac_address=device.mac_address,
+            room_id=device.room_id,
+            summary=summaries.get(device.id, MeasurementSummary()),
+            measurements=measurements,
+            measurements_cursor=next_cursor,
+            configs=[ConfigRead.from_orm(config) for config in device.configs],
+        ))
+    return reads
+
+
+async def get_device_by_mac(db: AsyncSession, mac_address: str, include_measurements: bool = False,
+                            measurements_limit: int = DEVICE_MEASUREMENTS_PAGE_SIZE,
+                            measurements_cursor: Optional[str] = None):
+    result = await db.execute(select(Device).where(Device.mac_address == mac_address).options(
+        selectinload(Device.configs)
+    ))
+    device = result.scalars().first()
     if not device:
         raise ValueError(f"Пристрій з mac-адресою '{mac_address}' не знайдено")
-    return DeviceRead.from_orm(device)
+    return (await build_device_reads(db, [device], include_measurements, measurements_limit, measurements_cursor))[0]
 
 
-def get_all_devices(db: Session):
-    devices = db.query(Device).options(
-        joinedload(Device.measurements),
-        joinedload(Device.configs)
-    ).all()
+async def get_all_devices(db: AsyncSession, include_measurements: bool = False,
+                          measurements_limit: int = DEVICE_MEASUREMENTS_PAGE_SIZE):
+    result = await db.execute(select(Device).order_by(Device.id).options(selectinload(Device.configs)))
+    devices = result.scalars().all()
     if not devices:
         raise ValueError("Пристроїв не існує")
-    return [DeviceRead.from_orm(device) for device in devices]
+    return await build_device_reads(db, devices, include_measurements, measurements_limit)
@@ -0,0 +1,195 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+
+from Constants import EXPORT_CHUNK_ROWS
+from get_db import SessionLocal
+from models.esp import Device
+from models.measurement import Measurement
+from time_utils import to_naive_utc
+
+EXPORT_COLUMNS = ("id", "device_id", "timestamp", "temperature", "humidity", "co2", "productivity")
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+
+class _ChunkSink(io.RawIOBase):
+    # Файлоподібний приймач для pyarrow: записані байти забираються після кожного пакета записів
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.int32()),
+        ("timestamp", pa.timestamp("us")),
+        ("temperature", pa.float64()),
+        ("humidity", pa.float64()),
+        ("co2", pa.float64()),
+        ("productivity", pa.int32()),
+    ])
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ValueError("Для форматів arrow та parquet потрібен пакет pyarrow")
+
+
+def encode_cursor(timestamp: datetime, measurement_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{measurement_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, measurement_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return to_naive_utc(datetime.fromisoformat(timestamp)), int(measurement_id)
+    except Exception:
+        raise ValueError("Некоректний токен продовження")
+
+
+def measurements_query(device_id: Optional[int] = None, room_id: Optional[int] = None,
+                       time_from: Optional[datetime] = None, time_to: Optional[datetime] = None,
+                       cursor: Optional[str] = None, limit: Optional[int] = None,
+                       conditions: Sequence = (), descending: bool = False,
+                       until: Optional[Tuple[datetime, int]] = None):
+    # Порядок (timestamp, id) збігається з індексами ix_measurements_timestamp_id та
+    # ix_measurements_device_id_timestamp_id, тож продовження з токена — це keyset-умова без OFFSET
+    query = select(*(Measurement.__table__.c[column] for column in EXPORT_COLUMNS))
+    for condition in conditions:
+        query = query.where(condition)
+    if device_id is not None:
+        query = query.where(Measurement.device_id == device_id)
+    if room_id is not None:
+        query = query.where(Measurement.device_id.in_(select(Device.id).where(Device.room_id == room_id)))
+    if time_from is not None:
+        query = query.where(Measurement.timestamp >= time_from)
+    if time_to is not None:
+        query = query.where(Measurement.timestamp <= time_to)
+    if cursor:
+        position = tuple_(Measurement.timestamp, Measurement.id)
+        boundary = tuple_(*decode_cursor(cursor))
+        query = query.where(position < boundary if descending else position > boundary)
+    if until:
+        # Кінець сторінки задається позицією, а не LIMIT: рядки, вставлені всередину сторінки
+        # після визначення її меж, потраплять у неї, а не зсунуть межу й не загубляться
+        position = tuple_(Measurement.timestamp, Measurement.id)
+        query = query.where(position >= tuple_(*until) if descending else position <= tuple_(*until))
+    if descending:
+        query = query.order_by(Measurement.timestamp.desc(), Measurement.id.desc())
+    else:
+        query = query.order_by(Measurement.timestamp, Measurement.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+async def page_end(db, query, limit: int) -> Optional[Tuple[datetime, int]]:
+    # (timestamp, id) останнього рядка сторінки з limit рядків, якщо за нею є ще рядки; читаються лише ключі
+    query = query.with_only_columns(Measurement.timestamp, Measurement.id).offset(limit - 1).limit(2)
+    rows = (await db.execute(query)).all()
+    return (rows[0][0], rows[0][1]) if len(rows) == 2 else None
+
+
+def _row_dict(row) -> dict:
+    data = dict(zip(EXPORT_COLUMNS, row))
+    data["timestamp"] = data["timestamp"].isoformat()
+    return data
+
+
+def _encode_chunk(rows, export_format: str, first: bool) -> str:
+    if export_format == "ndjson":
+        return "".join(json.dumps(_row_dict(row), ensure_ascii=False) + "\n" for row in rows)
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows((*row[:2], row[2].isoformat(), *row[3:]) for row in rows)
+        return buffer.getvalue()
+    body = ",".join(json.dumps(_row_dict(row), ensure_ascii=False) for row in rows)
+    return body if first else "," + body
+
+
+async def _stream_columnar(query, export_format: str) -> AsyncIterator[bytes]:
+    # Кожен блок курсора стає пакетом записів Arrow (або групою рядків Parquet) і одразу віддається клієнту
+    pa = require_pyarrow()
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    if export_format == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        writer = pa.parquet.ParquetWriter(sink, schema, compression="zstd")
+
+    try:
+        async with SessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+            async for rows in result.partitions():
+                columns = list(zip(*rows))
+                batch = pa.record_batch(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+                )
+                if export_format == "arrow":
+                    writer.write_batch(batch)
+                else:
+                    writer.write_table(pa.Table.from_batches([batch]))
+                yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+async def stream_measurements(query, export_format: str) -> AsyncIterator[bytes]:
+    if export_format in COLUMNAR_FORMATS:
+        async for chunk in _stream_columnar(query, export_format):
+            yield chunk
+        return
+
+    # Генератор відкриває власну сесію: залежність get_db закривається до того, як відповідь
+    # почне передаватися. Рядки читаються серверним курсором блоками по EXPORT_CHUNK_ROWS,
+    # а початок документа віддається ще до першого звернення до бази
+    if export_format == "json":
+        yield b"["
+    elif export_format == "csv":
+        yield (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+
+    first = True
+    async with SessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+        async for rows in result.partitions():
+            yield _encode_chunk(rows, export_format, first).encode()
+            first = False
+
+    if export_format == "json":
+        yield b"]"
@@ -0,0 +1,112 @@
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import iterate_in_threadpool
+
+from Constants import IMPORT_CHUNK_ROWS
+from get_db import engine
+from models.esp import Device
+from services import config_service, device_service, measurement_service, partition_service
+from services.export_service import require_pyarrow
+from services.productivity import ProductivityEvaluator
+
+REQUIRED_COLUMNS = ("timestamp", "temperature", "humidity", "co2")
+IMPORT_FORMATS = ("csv", "parquet")
+
+
+def detect_format(filename: str) -> str:
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError("Підтримуються лише файли .csv та .parquet")
+    return extension
+
+
+def _read_chunks(file: BinaryIO, file_format: str) -> Iterator[pd.DataFrame]:
+    if file_format == "parquet":
+        pa = require_pyarrow()
+        for batch in pa.parquet.ParquetFile(file).iter_batches(batch_size=IMPORT_CHUNK_ROWS):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(file, chunksize=IMPORT_CHUNK_ROWS)
+
+
+def _values(series: pd.Series, cast=float) -> List:
+    return [None if pd.isna(value) else cast(value) for value in series.tolist()]
+
+
+def _prepare_chunk(df: pd.DataFrame, evaluators: Dict[int, ProductivityEvaluator]) -> Tuple[List[Dict], int]:
+    # Відсутня продуктивність рахується векторно по кожному пристрою з його конфігурацією
+    df = df.copy()
+    for column in ("temperature", "humidity", "co2", "productivity"):
+        df[column] = pd.to_numeric(df[column], errors='coerce') if column in df else np.nan
+
+    missing = df['productivity'].isna() & df[['temperature', 'humidity', 'co2']].notna().all(axis=1)
+    computed = 0
+    for device_id, index in df[missing].groupby('device_id').groups.items():
+        evaluator = evaluators.get(device_id)
+        if evaluator is None:
+            continue
+        rows = df.loc[index]
+        df.loc[index, 'productivity'] = evaluator.score_array(rows['temperature'], rows['humidity'], rows['co2'])
+        computed += len(index)
+
+    records = [
+        dict(zip(measurement_service.MEASUREMENT_COLUMNS, values))
+        for values in zip(
+            df['device_id'].astype(int).tolist(),
+            df['timestamp'].dt.to_pydatetime().tolist(),
+            _values(df['temperature']),
+            _values(df['humidity']),
+            _values(df['co2']),
+            _values(df['productivity'], int),
+        )
+    ]
+    return records, computed
+
+
+async def import_measurements(db: AsyncSession, file: BinaryIO, file_format: str) -> Dict:
+    # Файл читається блоками по IMPORT_CHUNK_ROWS у пулі потоків; кожен блок записується через COPY
+    # разом з погодинними агрегатами, тож пам'ять не залежить від розміру файлу
+    summary = {"imported": 0, "computed_productivity": 0, "skipped": 0}
+    chunks = iterate_in_threadpool(_read_chunks(file, file_format))
+    async for df in chunks:
+        missing_columns = [column for column in REQUIRED_COLUMNS if column not in df]
+        if 'device_id' not in df and 'mac_address' not in df:
+            missing_columns.append('device_id або mac_address')
+        if missing_columns:
+            raise ValueError(f"У файлі відсутні колонки: {', '.join(missing_columns)}")
+
+        total = len(df)
+        if 'device_id' not in df:
+            devices = await device_service.resolve_devices(db, df['mac_address'].dropna().unique().tolist())
+            df['device_id'] = df['mac_address'].map({mac: device.id for mac, device in devices.items()})
+        df['device_id'] = pd.to_numeric(df['device_id'], errors='coerce')
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        if df['timestamp'].dt.tz is not None:
+            df['timestamp'] = df['timestamp'].dt.tz_convert(None)
+
+        known = set((await db.execute(
+            select(Device.id).where(Device.id.in_([int(device_id) for device_id in df['device_id'].dropna().unique()]))
+        )).scalars().all())
+        df = df[df['device_id'].isin(known) & df['timestamp'].notna()]
+        summary["skipped"] += total - len(df)
+        if df.empty:
+            continue
+
+        device_ids = [int(device_id) for device_id in df['device_id'].unique()]
+        evaluators = {device_id: entry.evaluator
+                      for device_id, entry in (await config_service.get_cached_configs(db, device_ids)).items()}
+        rows, computed = await run_in_threadpool(_prepare_chunk, df, evaluators)
+
+        async with engine.begin() as connection:
+            await partition_service.ensure_partitions(
+                connection, df['timestamp'].min().to_pydatetime(), df['timestamp'].max().to_pydatetime())
+        await measurement_service.copy_store_measurements(rows)
+        summary["imported"] += len(rows)
+        summary["computed_productivity"] += computed
+
+    return summary
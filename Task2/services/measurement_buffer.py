@@ -0,0 +1,193 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import asyncpg
+from sqlalchemy.exc import DataError, IntegrityError
+
+from logger import logger
+
+# Помилки самих даних: повтор не допоможе, тож пачка ділиться, а проблемні рядки відкидаються.
+# Решта помилок (обрив з'єднання, рестарт БД, вичерпаний пул) вважаються тимчасовими
+DATA_ERRORS = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError, IntegrityError, DataError,
+               ValueError, TypeError)
+
+
+@dataclass(eq=False)
+class FlushWaiter:
+    # Номери рядків одного запиту, що чекає на запис; failed — хоч один з них відкинуто
+    seqs: Set[int] = field(default_factory=set)
+    last_seq: int = 0
+    failed: bool = False
+
+
+class MeasurementBuffer:
+    # Обмежена черга вимірювань з фоновою задачею, яка записує їх пачками:
+    # кожні flush_rows рядків або кожні flush_interval секунд
+
+    def __init__(self, write: Callable[[List[Dict]], Awaitable[None]], max_rows: int, flush_rows: int,
+                 flush_interval: float, max_backoff: float):
+        self._write = write
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._rows = deque()
+        self._cond: Optional[asyncio.Condition] = None
+        self._enqueued = 0
+        self._flushed = 0
+        self._in_flight = 0
+        self._failures = 0
+        self._flush_requested = False
+        self._waiters: Set[FlushWaiter] = set()
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._running
+
+    async def start(self):
+        if self._running:
+            return
+        self._cond = asyncio.Condition()
+        self._running = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float):
+        # Під час зупинки тимчасові помилки теж повторюються, але не довше timeout;
+        # усе, що не встигло записатися, явно фіксується в лозі
+        if not self._running:
+            return
+        async with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            lost = len(self._rows) + self._in_flight
+            logger.error(f"Буфер не встиг записати до {lost} вимірювань за {timeout} с під час зупинки — їх втрачено")
+
+    async def _wait_for(self, predicate: Callable[[], bool], timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._cond.wait_for(predicate), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def register(self) -> FlushWaiter:
+        waiter = FlushWaiter()
+        self._waiters.add(waiter)
+        return waiter
+
+    def unregister(self, waiter: FlushWaiter):
+        self._waiters.discard(waiter)
+
+    async def append(self, row: Dict, timeout: float, waiter: Optional[FlushWaiter] = None) -> int:
+        async with self._cond:
+            if len(self._rows) >= self.max_rows:
+                self._flush_requested = True
+                self._cond.notify_all()
+                if not await self._wait_for(lambda: len(self._rows) < self.max_rows, timeout):
+                    raise RuntimeError("Буфер вимірювань переповнений")
+            self._rows.append(row)
+            self._enqueued += 1
+            if waiter is not None:
+                waiter.seqs.add(self._enqueued)
+                waiter.last_seq = self._enqueued
+            if len(self._rows) >= self.flush_rows:
+                self._cond.notify_all()
+            return self._enqueued
+
+    async def wait_flushed(self, waiter: FlushWaiter, timeout: float) -> bool:
+        # True лише тоді, коли всі рядки запиту записані, а не відкинуті як проблемні
+        async with self._cond:
+            if self._flushed < waiter.last_seq:
+                self._flush_requested = True
+                self._cond.notify_all()
+            if not await self._wait_for(lambda: self._flushed >= waiter.last_seq, timeout):
+                return False
+            return not waiter.failed
+
+    def _should_flush(self) -> bool:
+        return not self._running or self._flush_requested or len(self._rows) >= self.flush_rows
+
+    def _backoff(self) -> float:
+        return min(self.flush_interval * 2 ** self._failures, self.max_backoff)
+
+    async def _run(self):
+        while True:
+            async with self._cond:
+                await self._wait_for(self._should_flush, self.flush_interval)
+                if not self._rows:
+                    if not self._running:
+                        return
+                    continue
+                self._flush_requested = False
+                batch = [self._rows.popleft() for _ in range(min(len(self._rows), self.max_rows))]
+                first_seq = self._flushed + 1
+                self._in_flight = len(batch)
+                self._cond.notify_all()
+
+            try:
+                await self._write(batch)
+                dead_seqs = []
+            except DATA_ERRORS as e:
+                logger.error(f"Пачка з {len(batch)} вимірювань містить некоректні рядки, записуємо частинами: {str(e)}")
+                dead_seqs = await self._write_isolated(batch, first_seq)
+            except Exception as e:
+                # Тимчасова помилка: пачка повертається на початок черги без втрати порядку і номерів
+                logger.error(f"Помилка запису {len(batch)} вимірювань з буфера, повтор через "
+                             f"{self._backoff():.1f} с: {str(e)}")
+                async with self._cond:
+                    self._rows.extendleft(reversed(batch))
+                    self._in_flight = 0
+                await asyncio.sleep(self._backoff())
+                self._failures += 1
+                continue
+
+            self._failures = 0
+            async with self._cond:
+                for seq in dead_seqs:
+                    for waiter in self._waiters:
+                        if seq in waiter.seqs:
+                            waiter.failed = True
+                self._flushed = first_seq + len(batch) - 1
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    async def _write_retrying(self, rows: List[Dict]):
+        # Частина пачки, що вже ділиться, не повертається в чергу: тимчасові помилки повторюються на місці
+        failures = 0
+        while True:
+            try:
+                await self._write(rows)
+                return
+            except DATA_ERRORS:
+                raise
+            except Exception as e:
+                failures += 1
+                logger.error(f"Помилка запису {len(rows)} вимірювань, повтор (спроба {failures}): {str(e)}")
+                await asyncio.sleep(min(self.flush_interval * 2 ** failures, self.max_backoff))
+
+    async def _write_isolated(self, rows: List[Dict], first_seq: int) -> List[int]:
+        # Бісекція: один проблемний рядок (наприклад, порушення зовнішнього ключа для видаленого
+        # пристрою) не блокує запис решти пачки
+        dead_seqs = []
+        parts = [(first_seq, rows)]
+        while parts:
+            seq, part = parts.pop()
+            try:
+                await self._write_retrying(part)
+            except DATA_ERRORS as e:
+                if len(part) == 1:
+                    logger.error(f"Вимірювання відкинуто як некоректне: {part[0]}: {str(e)}")
+                    dead_seqs.append(seq)
+                    continue
+                middle = len(part) // 2
+                parts.append((seq + middle, part[middle:]))
+                parts.append((seq, part[:middle]))
+        if dead_seqs:
+            logger.error(f"Відкинуто {len(dead_seqs)} з {len(rows)} вимірювань пачки")
+        return dead_seqs
@@ -0,0 +1,54 @@
+import operator
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.measurement import Measurement
+from services import device_service, export_service
+
+THRESHOLD_METRICS = ("temperature", "humidity", "co2", "productivity")
+THRESHOLD_OPERATORS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    "=": operator.eq,
+}
+_THRESHOLD_PATTERN = re.compile(r"^\s*([a-z0-9_]+)\s*(>=|<=|!=|>|<|=)\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def parse_threshold(expression: str):
+    # Вираз виду "co2>1200" перетворюється на умову SQL
+    match = _THRESHOLD_PATTERN.match(expression.lower())
+    if not match:
+        raise ValueError(f"Некоректний фільтр '{expression}', очікується вигляд 'co2>1200'")
+    metric, operation, value = match.groups()
+    if metric not in THRESHOLD_METRICS:
+        raise ValueError(f"Невідомий показник '{metric}', доступні: {', '.join(THRESHOLD_METRICS)}")
+    return THRESHOLD_OPERATORS[operation](getattr(Measurement, metric), float(value))
+
+
+async def get_measurements_page(db: AsyncSession, limit: int, device_id: Optional[int] = None,
+                                mac_address: Optional[str] = None, room_id: Optional[int] = None,
+                                time_from: Optional[datetime] = None, time_to: Optional[datetime] = None,
+                                thresholds: List[str] = (), cursor: Optional[str] = None,
+                                descending: bool = False) -> Dict:
+    conditions = [parse_threshold(expression) for expression in thresholds]
+    if mac_address is not None:
+        device = await device_service.resolve_device(db, mac_address)
+        if device_id is not None and device_id != device.id:
+            return {"items": [], "next_cursor": None}
+        device_id = device.id
+
+    # Зайвий рядок показує, чи є наступна сторінка; токен — позиція останнього повернутого рядка
+    query = export_service.measurements_query(device_id, room_id, time_from, time_to, cursor, limit + 1,
+                                              conditions, descending)
+    rows = (await db.execute(query)).all()
+    items = [dict(zip(export_service.EXPORT_COLUMNS, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = export_service.encode_cursor(items[-1]["timestamp"], items[-1]["id"])
+    return {"items": items, "next_cursor": next_cursor}
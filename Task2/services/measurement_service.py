@@ -0,0 +1,80 @@
+from typing import List, Dict
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from Constants import INGEST_BUFFER_MAX_ROWS, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL_MS, \
+    INGEST_DURABLE_TIMEOUT_SECONDS, INGEST_RETRY_MAX_BACKOFF_SECONDS
+from get_db import engine
+from models.measurement import Measurement
+from services import rollup_service, statistics_cache
+from services.measurement_buffer import MeasurementBuffer
+
+MEASUREMENT_COLUMNS = ("device_id", "timestamp", "temperature", "humidity", "co2", "productivity")
+
+
+async def insert_measurements(db: AsyncSession, rows: List[Dict]) -> int:
+    # Один багаторядковий INSERT замість db.add на кожне вимірювання; commit робить викликач
+    if not rows:
+        return 0
+    await db.execute(insert(Measurement), rows)
+    return len(rows)
+
+
+async def copy_measurements(connection: AsyncConnection, rows: List[Dict]) -> int:
+    if not rows:
+        return 0
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        Measurement.__tablename__,
+        records=[tuple(row.get(column) for column in MEASUREMENT_COLUMNS) for row in rows],
+        columns=MEASUREMENT_COLUMNS
+    )
+    return len(rows)
+
+
+async def copy_store_measurements(rows: List[Dict]):
+    # COPY разом з оновленням погодинних агрегатів в одній транзакції; використовується буфером і масовим імпортом.
+    # Агрегати пачки до 50000 рядків рахуються в пулі потоків ще до відкриття транзакції, щоб не блокувати цикл подій
+    aggregates = await run_in_threadpool(rollup_service.aggregate, rows)
+    async with engine.begin() as connection:
+        await copy_measurements(connection, rows)
+        await rollup_service.apply_aggregates(connection, aggregates)
+    statistics_cache.record_ingest(rows)
+
+
+measurement_buffer = MeasurementBuffer(
+    write=copy_store_measurements,
+    max_rows=INGEST_BUFFER_MAX_ROWS,
+    flush_rows=INGEST_FLUSH_ROWS,
+    flush_interval=INGEST_FLUSH_INTERVAL_MS / 1000,
+    max_backoff=INGEST_RETRY_MAX_BACKOFF_SECONDS
+)
+
+
+async def store_measurements(db: AsyncSession, rows: List[Dict], durable: bool = False) -> int:
+    # У буферизованому режимі вимірювання записуються фоновою задачею;
+    # чекаємо на запис лише тоді, коли клієнт явно вимагає durable
+    if not measurement_buffer.enabled:
+        try:
+            stored = await insert_measurements(db, rows)
+            await rollup_service.apply(db, rows)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        statistics_cache.record_ingest(rows)
+        return stored
+
+    waiter = measurement_buffer.register() if durable else None
+    try:
+        for row in rows:
+            await measurement_buffer.append(row, INGEST_DURABLE_TIMEOUT_SECONDS, waiter)
+        if waiter is not None and rows and not await measurement_buffer.wait_flushed(
+                waiter, INGEST_DURABLE_TIMEOUT_SECONDS):
+            raise RuntimeError("Не вдалося підтвердити запис вимірювань у базу даних")
+    finally:
+        if waiter is not None:
+            measurement_buffer.unregister(waiter)
+    return len(rows)
@@ -0,0 +1,166 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from Constants import MEASUREMENT_PARTITIONS_AHEAD, PARTITION_MAINTENANCE_INTERVAL_SECONDS
+from get_db import engine, close_connection
+from logger import logger
+from models.measurement import Measurement
+
+TABLE = Measurement.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+LEGACY_TABLE = f"{TABLE}_legacy"
+# Довільний ключ advisory-блокування, щоб кілька воркерів не створювали секції одночасно
+PARTITION_LOCK_KEY = 7310001
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+async def _exists(connection: AsyncConnection, name: str) -> bool:
+    return (await connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar()
+
+
+async def _create_partition(connection: AsyncConnection, month: datetime) -> bool:
+    name = f"{TABLE}_{month:%Y_%m}"
+    if await _exists(connection, name):
+        return False
+
+    start, end = f"'{month:%Y-%m-%d}'", f"'{_add_months(month, 1):%Y-%m-%d}'"
+    in_range = f"timestamp >= {start} AND timestamp < {end}"
+    create = f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ({start}) TO ({end})"
+
+    moving = await _exists(connection, DEFAULT_PARTITION) and (await connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})")
+    )).scalar()
+    if not moving:
+        await connection.execute(text(create))
+    else:
+        # Рядки цього місяця вже потрапили в секцію за замовчуванням — переносимо їх у нову секцію,
+        # інакше PostgreSQL не дозволить її створити
+        await connection.execute(text(
+            f"CREATE TEMP TABLE {TABLE}_moving ON COMMIT DROP AS SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"
+        ))
+        await connection.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        await connection.execute(text(create))
+        await connection.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_moving"))
+        await connection.execute(text(f"DROP TABLE {TABLE}_moving"))
+    logger.info(f"Створено секцію {name}")
+    return True
+
+
+async def ensure_partitions(connection: AsyncConnection, time_from: datetime, time_to: datetime) -> int:
+    # Помісячні секції для [time_from, time_to] і секція за замовчуванням для всього, що поза ними
+    await connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    created = 0
+    month = _month_start(time_from)
+    while month <= time_to:
+        created += await _create_partition(connection, month)
+        month = _add_months(month, 1)
+    await connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+    return created
+
+
+async def migrate_legacy_table(connection: AsyncConnection) -> int:
+    # Перетворює несекціоновану таблицю measurements (Integer id) на секціоновану з BigInteger id.
+    # Стара таблиця лишається як measurements_legacy, її можна видалити після перевірки
+    relkind = (await connection.execute(text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:name)"),
+                                        {"name": TABLE})).scalar()
+    if relkind != "r":
+        return 0
+
+    logger.info(f"Перенесення таблиці {TABLE} у секціоновану")
+    for statement in (
+        f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}",
+        f"ALTER INDEX IF EXISTS {TABLE}_pkey RENAME TO {LEGACY_TABLE}_pkey",
+        f"ALTER INDEX IF EXISTS ix_{TABLE}_id RENAME TO ix_{LEGACY_TABLE}_id",
+        f"ALTER TABLE {LEGACY_TABLE} ALTER COLUMN id DROP DEFAULT",
+        # Послідовність переходить до нової таблиці, тож нумерація продовжується без setval
+        f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY NONE",
+        f"ALTER SEQUENCE {TABLE}_id_seq AS bigint",
+    ):
+        await connection.execute(text(statement))
+    await connection.run_sync(lambda sync_connection: Measurement.__table__.create(sync_connection, checkfirst=True))
+
+    bounds = (await connection.execute(text(f"SELECT min(timestamp), max(timestamp) FROM {LEGACY_TABLE}"))).first()
+    if bounds[0] is not None:
+        await ensure_partitions(connection, bounds[0], bounds[1])
+
+    columns = ", ".join(column.name for column in Measurement.__table__.columns)
+    moved = (await connection.execute(text(
+        f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {LEGACY_TABLE} WHERE timestamp IS NOT NULL"
+    ))).rowcount
+    skipped = (await connection.execute(text(f"SELECT count(*) FROM {LEGACY_TABLE} WHERE timestamp IS NULL"))).scalar()
+    if skipped:
+        logger.warning(f"{skipped} вимірювань без timestamp не перенесено, вони лишилися в {LEGACY_TABLE}")
+    logger.info(f"Перенесено {moved} вимірювань; після перевірки таблицю {LEGACY_TABLE} можна видалити")
+    return moved
+
+
+# Індекси, замінені ширшими; видаляються під час підготовки таблиці
+OBSOLETE_INDEXES = ("ix_measurements_device_id_timestamp",)
+
+
+def _create_indexes(sync_connection):
+    # create_all не додає нові індекси до вже існуючої таблиці
+    for index in Measurement.__table__.indexes:
+        index.create(sync_connection, checkfirst=True)
+    for name in OBSOLETE_INDEXES:
+        sync_connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+async def prepare():
+    now = datetime.utcnow()
+    async with engine.begin() as connection:
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+        await migrate_legacy_table(connection)
+        await connection.run_sync(_create_indexes)
+        await ensure_partitions(connection, now, _add_months(_month_start(now), MEASUREMENT_PARTITIONS_AHEAD))
+
+
+async def _run_maintenance():
+    while True:
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            now = datetime.utcnow()
+            async with engine.begin() as connection:
+                await ensure_partitions(connection, now, _add_months(_month_start(now), MEASUREMENT_PARTITIONS_AHEAD))
+        except Exception as e:
+            logger.error(f"Помилка при створенні секцій вимірювань: {str(e)}")
+
+
+def start_maintenance():
+    global _maintenance_task
+    if _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_run_maintenance())
+
+
+async def stop_maintenance():
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
+
+
+async def _main():
+    await prepare()
+    await close_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
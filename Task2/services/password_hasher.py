@@ -0,0 +1,101 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from passlib.context import CryptContext
+
+from Constants import BCRYPT_ROUNDS, PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, \
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS
+
+# Хеші з іншою вартістю лишаються дійсними; нові паролі хешуються з BCRYPT_ROUNDS
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # bcrypt виконується в окремому обмеженому пулі, а не в спільному пулі потоків FastAPI, тож шторм входів
+    # не забирає потоки в прийому вимірювань. Одночасно виконується не більше workers хешувань, решта чекає
+    # у черзі до queue_timeout; якщо в черзі вже max_pending запитів, новий відхиляється одразу.
+    # Модуль не імпортує нічого, крім passlib і Constants, тож пул процесів не підключається до бази даних
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float, executor: str = "thread"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0, "running": 0, "queued": 0,
+                         "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "run_seconds_total": 0.0}
+
+    def _ensure(self):
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def _run(self, function: Callable, *args):
+        self._ensure()
+        if self.counters["queued"] >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise PasswordHasherBusy()
+
+        queued_at = time.perf_counter()
+        self.counters["queued"] += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["timed_out"] += 1
+            raise PasswordHasherBusy()
+        finally:
+            self.counters["queued"] -= 1
+
+        started_at = time.perf_counter()
+        wait = started_at - queued_at
+        self.counters["wait_seconds_total"] += wait
+        self.counters["wait_seconds_max"] = max(self.counters["wait_seconds_max"], wait)
+        self.counters["running"] += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+            self.counters["completed"] += 1
+            return result
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        finally:
+            self.counters["running"] -= 1
+            self.counters["run_seconds_total"] += time.perf_counter() - started_at
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(check_password, plain_password, hashed_password)
+
+    def info(self):
+        return {**self.counters, "workers": self.workers, "executor": self.executor_kind, "rounds": BCRYPT_ROUNDS}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+                                 PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS, PASSWORD_HASH_EXECUTOR)
@@ -0,0 +1,110 @@
+import math
+from dataclasses import dataclass, fields
+from typing import Dict, List, Union
+
+import numpy as np
+
+TEMPERATURE_WEIGHT = 5
+HUMIDITY_WEIGHT = 3
+CO2_WEIGHT = 1
+WEIGHT_EXPONENT = 1 / (TEMPERATURE_WEIGHT + HUMIDITY_WEIGHT + CO2_WEIGHT)
+LOG_3 = math.log(3)
+DEFAULT_PRODUCTIVITY_NORM = 80
+
+# Скаляр для однієї конфігурації або масив, вирівняний з показами (див. ProductivityEvaluator.stack)
+Value = Union[float, np.ndarray]
+
+
+@dataclass(frozen=True, slots=True)
+class ProductivityEvaluator:
+    # Конфігурація пристрою, розкладена в плоскі числові поля один раз при завантаженні;
+    # обчислення не звертаються до вкладених словників
+    temperature_ideal: Value
+    temperature_min: Value
+    temperature_max: Value
+    humidity_ideal: Value
+    humidity_min: Value
+    humidity_max: Value
+    co2_ideal: Value
+    co2_min: Value
+    co2_max: Value
+    co2_span: Value
+    productivity_norm: Value
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ProductivityEvaluator":
+        ideal, min_values, max_values = config['ideal_values'], config['min_values'], config['max_values']
+        return cls(
+            temperature_ideal=ideal['Temperature'],
+            temperature_min=min_values['Temperature'],
+            temperature_max=max_values['Temperature'],
+            humidity_ideal=ideal['Humidity'],
+            humidity_min=min_values['Humidity'],
+            humidity_max=max_values['Humidity'],
+            co2_ideal=ideal['CO2'],
+            co2_min=min_values['CO2'],
+            co2_max=max_values['CO2'],
+            co2_span=max_values['CO2'] - ideal['CO2'],
+            productivity_norm=config.get('productivity_norm', DEFAULT_PRODUCTIVITY_NORM),
+        )
+
+    @classmethod
+    def stack(cls, evaluators: List["ProductivityEvaluator"]) -> "ProductivityEvaluator":
+        # Поля стають масивами: i-й показ оцінюється за i-ю конфігурацією
+        return cls(**{
+            field.name: np.array([getattr(evaluator, field.name) for evaluator in evaluators], dtype=float)
+            for field in fields(cls)
+        })
+
+    def score(self, temperature: float, humidity: float, co2: float) -> int:
+        # Показ поза діапазоном обнуляє відповідну оцінку, а з нею і загальну
+        if (temperature < self.temperature_min or temperature > self.temperature_max
+                or humidity < self.humidity_min or humidity > self.humidity_max
+                or co2 < self.co2_min or co2 > self.co2_max):
+            return 0
+
+        temperature_score = math.exp(-((temperature - self.temperature_ideal) ** 2) / 50)
+        humidity_score = math.exp(-((humidity - self.humidity_ideal) ** 2) / 100)
+        if co2 <= self.co2_ideal:
+            co2_score = 1
+        else:
+            co2_score = 1 - math.log(1 + (co2 - self.co2_ideal) / self.co2_span) / LOG_3
+
+        return round((
+            temperature_score ** TEMPERATURE_WEIGHT *
+            humidity_score ** HUMIDITY_WEIGHT *
+            co2_score ** CO2_WEIGHT
+        ) ** WEIGHT_EXPONENT * 100)
+
+    def score_array(self, temperature, humidity, co2) -> np.ndarray:
+        return np.round(self.overall_array(temperature, humidity, co2)).astype(int)
+
+    def overall_array(self, temperature, humidity, co2) -> np.ndarray:
+        # Та сама формула над масивами без округлення; форми показів і полів узгоджуються за правилами
+        # broadcasting. Для осей форми (n,1,1), (1,m,1), (1,1,k) часткові оцінки рахуються лише
+        # вздовж своєї осі, а на всю сітку припадає тільки добуток
+        temperature = np.asarray(temperature, dtype=float)
+        humidity = np.asarray(humidity, dtype=float)
+        co2 = np.asarray(co2, dtype=float)
+
+        temperature_score = np.exp(-((temperature - self.temperature_ideal) ** 2) / 50)
+        humidity_score = np.exp(-((humidity - self.humidity_ideal) ** 2) / 100)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            co2_score = np.where(
+                co2 <= self.co2_ideal,
+                1.0,
+                1 - np.log(1 + (co2 - self.co2_ideal) / self.co2_span) / LOG_3
+            )
+
+        temperature_score = np.where(
+            (temperature < self.temperature_min) | (temperature > self.temperature_max), 0.0, temperature_score)
+        humidity_score = np.where(
+            (humidity < self.humidity_min) | (humidity > self.humidity_max), 0.0, humidity_score)
+        co2_score = np.where((co2 < self.co2_min) | (co2 > self.co2_max), 0.0, co2_score)
+
+        with np.errstate(invalid='ignore'):
+            return (
+                temperature_score ** TEMPERATURE_WEIGHT *
+                humidity_score ** HUMIDITY_WEIGHT *
+                co2_score ** CO2_WEIGHT
+            ) ** WEIGHT_EXPONENT * 100
@@ -0,0 +1,87 @@
+import math
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from Constants import SKETCH_RELATIVE_ACCURACY
+
+MIN_INDEXABLE_VALUE = 1e-9
+
+
+class QuantileSketch:
+    # Зливаний скетч квантилів із логарифмічними кошиками (DDSketch): будь-який квантиль
+    # повертається з відносною похибкою не більше relative_accuracy. Кошики — словник
+    # "p<i>"/"n<i>"/"z" -> кількість, тому два скетчі зливаються простим додаванням лічильників.
+    # Зміна relative_accuracy робить збережені скетчі несумісними — їх треба перебудувати.
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY, bins: Optional[Dict[str, int]] = None):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.ln_gamma = math.log(self.gamma)
+        self.bins: Dict[str, int] = {}
+        self.count = 0
+        if bins:
+            self.merge(bins)
+
+    def key(self, value: float) -> str:
+        if abs(value) < MIN_INDEXABLE_VALUE:
+            return "z"
+        index = math.ceil(math.log(abs(value)) / self.ln_gamma)
+        return f"p{index}" if value > 0 else f"n{index}"
+
+    def add(self, value: float, count: int = 1):
+        key = self.key(value)
+        self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def update_array(self, values: np.ndarray):
+        # Векторизований варіант update для блоків рядків; індекси кошиків збігаються з key()
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return
+        zero = np.abs(values) < MIN_INDEXABLE_VALUE
+        self.merge({"z": int(zero.sum())} if zero.any() else {})
+        values = values[~zero]
+        indexes = np.ceil(np.log(np.abs(values)) / self.ln_gamma).astype(np.int64)
+        for prefix, mask in (("p", values > 0), ("n", values < 0)):
+            keys, counts = np.unique(indexes[mask], return_counts=True)
+            self.merge({f"{prefix}{key}": count for key, count in zip(keys.tolist(), counts.tolist())})
+
+    def merge(self, bins: Dict[str, int]):
+        for key, count in bins.items():
+            count = int(count)
+            self.bins[key] = self.bins.get(key, 0) + count
+            self.count += count
+
+    def _value(self, key: str) -> float:
+        if key == "z":
+            return 0.0
+        value = 2 * self.gamma ** int(key[1:]) / (self.gamma + 1)
+        return value if key[0] == "p" else -value
+
+    def _ordered_keys(self):
+        negative = sorted((key for key in self.bins if key[0] == "n"), key=lambda key: -int(key[1:]))
+        positive = sorted((key for key in self.bins if key[0] == "p"), key=lambda key: int(key[1:]))
+        return negative + (["z"] if "z" in self.bins else []) + positive
+
+    def quantiles(self, qs: Iterable[float]):
+        qs = list(qs)
+        if not self.count:
+            return [None] * len(qs)
+        keys = self._ordered_keys()
+        results = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            seen = 0
+            for key in keys:
+                seen += self.bins[key]
+                if seen > rank:
+                    results.append(self._value(key))
+                    break
+            else:
+                results.append(self._value(keys[-1]))
+        return results
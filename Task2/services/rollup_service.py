@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, case, cast, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from get_db import engine, close_connection
+from logger import logger
+from models.measurement_hourly import MeasurementHourly
+from services import sql_statistics_service
+from services import sketch_service
+from services.stats_math import METRICS, build_parameter_stats, trend_stats, floor_hour, ceil_hour
+from sсhemas.analytics import StatisticsOutput
+
+# Агрегати наповнюються під час запису, тож історію, записану до появи measurement_hourly, після розгортання
+# треба один раз дозаповнити (python -m services.rollup_service). Від неї залежать статистика та
+# кількість вимірювань пристроїв у device_service
+MOMENTS = ("count", "mean", "m2", "m3", "m4", "min", "max")
+ROLLUP_COLUMNS = ["device_id", "hour", "row_count", "first_timestamp", "last_timestamp"] + [
+    f"{metric}_{suffix}" for metric in METRICS for suffix in MOMENTS
+]
+# Ключ advisory-блокування для переходу measurement_hourly від сум степенів до центральних моментів
+ROLLUP_LOCK_KEY = 7310003
+
+
+def _empty_bucket(device_id: int, hour: datetime) -> Dict:
+    bucket = {"device_id": device_id, "hour": hour, "row_count": 0, "first_timestamp": None, "last_timestamp": None}
+    for metric in METRICS:
+        bucket.update({f"{metric}_count": 0, f"{metric}_mean": 0.0, f"{metric}_m2": 0.0, f"{metric}_m3": 0.0,
+                       f"{metric}_m4": 0.0, f"{metric}_min": None, f"{metric}_max": None})
+    return bucket
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def aggregate_rows(rows: List[Dict]) -> List[Dict]:
+    buckets, values = {}, {}
+    for row in rows:
+        if row.get("device_id") is None:
+            continue
+        timestamp = row["timestamp"]
+        key = (row["device_id"], floor_hour(timestamp))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _empty_bucket(*key)
+            values[key] = {metric: [] for metric in METRICS}
+        bucket["row_count"] += 1
+        bucket["first_timestamp"] = _min(bucket["first_timestamp"], timestamp)
+        bucket["last_timestamp"] = _max(bucket["last_timestamp"], timestamp)
+        for metric in METRICS:
+            if row.get(metric) is not None:
+                values[key][metric].append(float(row[metric]))
+
+    # Два проходи: спершу середнє, потім суми степенів відхилень від нього
+    for key, bucket in buckets.items():
+        for metric, metric_values in values[key].items():
+            if not metric_values:
+                continue
+            mean = math.fsum(metric_values) / len(metric_values)
+            deviations = [value - mean for value in metric_values]
+            bucket.update({
+                f"{metric}_count": len(metric_values),
+                f"{metric}_mean": mean,
+                f"{metric}_m2": math.fsum(d ** 2 for d in deviations),
+                f"{metric}_m3": math.fsum(d ** 3 for d in deviations),
+                f"{metric}_m4": math.fsum(d ** 4 for d in deviations),
+                f"{metric}_min": min(metric_values),
+                f"{metric}_max": max(metric_values),
+            })
+    # Стабільний порядок ключів, щоб паралельні upsert-и не блокували один одного навхрест
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def _merged_moments(table, excluded, metric: str) -> Dict:
+    # Об'єднання моментів наявного та нового агрегату тими ж формулами Pébay, що й stats_math.merge_moments.
+    # Лічильники переводяться в double precision: bigint-ділення цілочисельне, а n³ виходить за межі bigint
+    n_a = cast(table.c[f"{metric}_count"], Float)
+    n_b = cast(excluded[f"{metric}_count"], Float)
+    mean_a, mean_b = table.c[f"{metric}_mean"], excluded[f"{metric}_mean"]
+    m2_a, m2_b = table.c[f"{metric}_m2"], excluded[f"{metric}_m2"]
+    m3_a, m3_b = table.c[f"{metric}_m3"], excluded[f"{metric}_m3"]
+    m4_a, m4_b = table.c[f"{metric}_m4"], excluded[f"{metric}_m4"]
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    merged = {
+        "mean": mean_a + delta * n_b / n,
+        "m2": m2_a + m2_b + delta * delta * n_a * n_b / n,
+        "m3": (m3_a + m3_b + delta * delta * delta * n_a * n_b * (n_a - n_b) / (n * n)
+               + 3 * delta * (n_a * m2_b - n_b * m2_a) / n),
+        "m4": (m4_a + m4_b + delta * delta * delta * delta * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b) / (n * n * n)
+               + 6 * delta * delta * (n_a * n_a * m2_b + n_b * n_b * m2_a) / (n * n)
+               + 4 * delta * (n_a * m3_b - n_b * m3_a) / n),
+    }
+    a = {"mean": mean_a, "m2": m2_a, "m3": m3_a, "m4": m4_a}
+    b = {"mean": mean_b, "m2": m2_b, "m3": m3_b, "m4": m4_b}
+    return {
+        f"{metric}_{suffix}": case((n_b == 0, a[suffix]), (n_a == 0, b[suffix]), else_=expression)
+        for suffix, expression in merged.items()
+    }
+
+
+def _upsert_statement():
+    table = MeasurementHourly.__table__
+    statement = insert(table)
+    excluded = statement.excluded
+    values = {
+        "row_count": table.c.row_count + excluded.row_count,
+        "first_timestamp": func.least(table.c.first_timestamp, excluded.first_timestamp),
+        "last_timestamp": func.greatest(table.c.last_timestamp, excluded.last_timestamp),
+    }
+    for metric in METRICS:
+        values[f"{metric}_count"] = table.c[f"{metric}_count"] + excluded[f"{metric}_count"]
+        values.update(_merged_moments(table, excluded, metric))
+        values[f"{metric}_min"] = func.least(table.c[f"{metric}_min"], excluded[f"{metric}_min"])
+        values[f"{metric}_max"] = func.greatest(table.c[f"{metric}_max"], excluded[f"{metric}_max"])
+    return statement.on_conflict_do_update(index_elements=["device_id", "hour"], set_=values)
+
+
+_upsert = _upsert_statement()
+
+
+def aggregate(rows: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    # Погодинні агрегати та скетчі пачки рахуються в чистому Python; великі пачки передають це в пул потоків
+    return aggregate_rows(rows), sketch_service.aggregate_rows(rows)
+
+
+async def apply_aggregates(executor, aggregates: Tuple[List[Dict], List[Dict]]):
+    # executor — AsyncSession або AsyncConnection тієї ж транзакції, що записує вимірювання
+    buckets, sketches = aggregates
+    if buckets:
+        await executor.execute(_upsert, buckets)
+        await sketch_service.apply(executor, sketches)
+
+
+async def apply(executor, rows: List[Dict]):
+    await apply_aggregates(executor, aggregate(rows))
+
+
+def _aggregate_sql(where: str, room_id: Optional[int] = None) -> str:
+    # Центральні моменти за два проходи: віконне середнє години, потім суми степенів відхилень від нього
+    values = ",\n".join(
+        f"""{metric}::double precision AS {metric},
+                avg({metric}::double precision) OVER hour_window AS {metric}_avg"""
+        for metric in METRICS
+    )
+    metrics = ",\n".join(
+        f"""count({metric}) AS {metric}_count,
+            coalesce(avg({metric}), 0) AS {metric}_mean,
+            coalesce(sum(power({metric} - {metric}_avg, 2)), 0) AS {metric}_m2,
+            coalesce(sum(power({metric} - {metric}_avg, 3)), 0) AS {metric}_m3,
+            coalesce(sum(power({metric} - {metric}_avg, 4)), 0) AS {metric}_m4,
+            min({metric}) AS {metric}_min,
+            max({metric}) AS {metric}_max"""
+        for metric in METRICS
+    )
+    room_filter = "AND device_id IN (SELECT id FROM devices WHERE room_id = :room_id)" if room_id else ""
+    return f"""
+        SELECT device_id, hour, count(*) AS row_count,
+            min(timestamp) AS first_timestamp, max(timestamp) AS last_timestamp,
+            {metrics}
+        FROM (
+            SELECT device_id, timestamp, date_trunc('hour', timestamp) AS hour,
+                {values}
+            FROM measurements
+            WHERE device_id IS NOT NULL AND ({where}) {room_filter}
+            WINDOW hour_window AS (PARTITION BY device_id, date_trunc('hour', timestamp))
+        ) m
+        GROUP BY device_id, hour
+    """
+
+
+async def rebuild(connection, time_from: Optional[datetime] = None, time_to: Optional[datetime] = None) -> int:
+    # Перераховує цілі години [floor(time_from), floor(time_to) + 1 год) з таблиці measurements
+    conditions, hour_conditions, params = ["TRUE"], ["TRUE"], {}
+    if time_from:
+        params["time_from"] = floor_hour(time_from)
+        conditions.append("timestamp >= :time_from")
+        hour_conditions.append("hour >= :time_from")
+    if time_to:
+        params["time_to"] = floor_hour(time_to) + timedelta(hours=1)
+        conditions.append("timestamp < :time_to")
+        hour_conditions.append("hour < :time_to")
+
+    await connection.execute(
+        text(f"DELETE FROM {MeasurementHourly.__tablename__} WHERE {' AND '.join(hour_conditions)}"), params
+    )
+    result = await connection.execute(
+        text(f"INSERT INTO {MeasurementHourly.__tablename__} ({', '.join(ROLLUP_COLUMNS)}) "
+             f"{_aggregate_sql(' AND '.join(conditions))}"),
+        params
+    )
+    await sketch_service.rebuild(connection, ' AND '.join(conditions), ' AND '.join(hour_conditions), params)
+    return result.rowcount
+
+
+def _buckets_sql(edges: str, room_id: Optional[int] = None, inner: bool = False) -> str:
+    # Повні години всередині вікна беруться з measurement_hourly, неповні години на краях — із сирих рядків
+    edge_buckets = _aggregate_sql(edges, room_id)
+    if not inner:
+        return edge_buckets
+    room_filter = "AND device_id IN (SELECT id FROM devices WHERE room_id = :room_id)" if room_id else ""
+    return f"""
+        SELECT {', '.join(ROLLUP_COLUMNS)}
+        FROM {MeasurementHourly.__tablename__}
+        WHERE hour >= :inner_from AND hour < :inner_to {room_filter}
+        UNION ALL
+        {edge_buckets}
+    """
+
+
+def _totals_sql(buckets: str) -> str:
+    # Підсумки по пристрою зводить PostgreSQL: кількості та екстремуми адитивні, а центральні моменти
+    # годин переносяться до спільного середнього пристрою (d — відхилення середнього години від нього)
+    means = ", ".join(
+        f"sum({metric}_count * {metric}_mean) / nullif(sum({metric}_count), 0) AS {metric}_mean" for metric in METRICS
+    )
+    metrics = ",\n".join(
+        f"""sum(b.{metric}_count)::bigint AS {metric}_count,
+            max(d.{metric}_mean) AS {metric}_mean,
+            sum(b.{metric}_m2 + b.{metric}_count * power(b.{metric}_mean - d.{metric}_mean, 2)) AS {metric}_m2,
+            sum(b.{metric}_m3 + 3 * (b.{metric}_mean - d.{metric}_mean) * b.{metric}_m2
+                + b.{metric}_count * power(b.{metric}_mean - d.{metric}_mean, 3)) AS {metric}_m3,
+            sum(b.{metric}_m4 + 4 * (b.{metric}_mean - d.{metric}_mean) * b.{metric}_m3
+                + 6 * power(b.{metric}_mean - d.{metric}_mean, 2) * b.{metric}_m2
+                + b.{metric}_count * power(b.{metric}_mean - d.{metric}_mean, 4)) AS {metric}_m4,
+            min(b.{metric}_min) AS {metric}_min,
+            max(b.{metric}_max) AS {metric}_max"""
+        for metric in METRICS
+    )
+    return f"""
+        WITH buckets AS ({buckets}),
+        device_means AS (SELECT device_id, {means} FROM buckets GROUP BY device_id)
+        SELECT b.device_id, min(b.first_timestamp) AS first_timestamp, max(b.last_timestamp) AS last_timestamp,
+            {metrics}
+        FROM buckets b
+        JOIN device_means d ON d.device_id = b.device_id
+        GROUP BY b.device_id
+        ORDER BY b.device_id
+    """
+
+
+def _trends_sql(buckets: str) -> str:
+    # Погодинні агрегати зводяться до години, дня чи тижня зваженим за кількістю середнім
+    means = ", ".join(
+        f"sum({metric}_count * {metric}_mean) / nullif(sum({metric}_count), 0) AS {metric}" for metric in METRICS
+    )
+    return f"""
+        WITH buckets AS ({buckets})
+        SELECT device_id, date_trunc(:granularity, hour) AS bucket, {means}
+        FROM buckets
+        GROUP BY device_id, date_trunc(:granularity, hour)
+        ORDER BY device_id, bucket
+    """
+
+
+async def get_statistics(db, time_from: datetime, time_to: datetime, room_id: Optional[int] = None,
+                         quantiles: str = "approx", granularity: str = "hour",
+                         max_points: Optional[int] = None) -> List[StatisticsOutput]:
+    # Середнє, std, екстремуми, моменти й тренди — з погодинних агрегатів, сирі рядки лише для неповних
+    # годин на краях вікна. Квартилі за замовчуванням зі скетчів; quantiles="exact" рахує їх по сирих рядках
+    inner_from, inner_to = ceil_hour(time_from), floor_hour(time_to)
+    params = {"time_from": time_from, "time_to": time_to}
+    if room_id:
+        params["room_id"] = room_id
+
+    inner = inner_from < inner_to
+    if inner:
+        params.update({"inner_from": inner_from, "inner_to": inner_to})
+        edges = "(timestamp >= :time_from AND timestamp < :inner_from) " \
+                "OR (timestamp >= :inner_to AND timestamp <= :time_to)"
+    else:
+        edges = "timestamp BETWEEN :time_from AND :time_to"
+    buckets = _buckets_sql(edges, room_id, inner)
+
+    totals = (await db.execute(text(_totals_sql(buckets)), params)).mappings().all()
+    if not totals:
+        return []
+
+    if quantiles == "approx":
+        quartiles = await sketch_service.get_quartiles(db, time_from, time_to, room_id)
+    else:
+        quartiles = await sql_statistics_service.get_quartiles(db, time_from, time_to, room_id)
+
+    # Похвилинних даних у погодинних агрегатах немає — такі тренди рахуються з сирих рядків
+    if granularity == "minute":
+        trends = await sql_statistics_service.get_trend_buckets(db, time_from, time_to, room_id, granularity)
+    else:
+        trends = {}
+        for row in (await db.execute(text(_trends_sql(buckets)), {**params, "granularity": granularity})).mappings():
+            trends.setdefault(row["device_id"], []).append(
+                (row["bucket"], {metric: row[metric] for metric in METRICS})
+            )
+
+    device_stats = []
+    for row in totals:
+        stats = {}
+        for metric in METRICS:
+            count = row[f"{metric}_count"]
+            mean = m2 = m3 = m4 = std = None
+            if count:
+                mean, m2, m3, m4 = (row[f"{metric}_{suffix}"] for suffix in ("mean", "m2", "m3", "m4"))
+                m2 = max(m2, 0.0)
+                std = math.sqrt(m2 / (count - 1)) if count > 1 else None
+            stats[metric] = build_parameter_stats(
+                count, mean, std, row[f"{metric}_min"], row[f"{metric}_max"],
+                quartiles.get(row["device_id"], {}).get(metric), m2, m3, m4
+            )
+
+        start_time, end_time = row["first_timestamp"], row["last_timestamp"]
+        stats["time_stats"] = {
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat(),
+            'duration': (end_time - start_time).total_seconds() / 3600,
+            **trend_stats(trends.get(row["device_id"], []), granularity, max_points)
+        }
+        device_stats.append(StatisticsOutput(device_id=f'device_{row["device_id"]}', **stats))
+
+    return device_stats
+
+
+async def prepare():
+    # Агрегати зі старою схемою (Σx..Σx⁴) переводяться в центральні моменти на місці, без перебудови історії
+    table = MeasurementHourly.__tablename__
+    async with engine.begin() as connection:
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+        legacy = (await connection.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column)"
+        ), {"table": table, "column": f"{METRICS[0]}_sum"})).scalar()
+        if not legacy:
+            return
+        for metric in METRICS:
+            n, mean = f"{metric}_count", f"({metric}_sum / {metric}_count)"
+            await connection.execute(text(
+                f"ALTER TABLE {table} "
+                + ", ".join(f"ADD COLUMN {metric}_{suffix} double precision NOT NULL DEFAULT 0"
+                            for suffix in ("mean", "m2", "m3", "m4"))
+            ))
+            await connection.execute(text(f"""
+                UPDATE {table} SET
+                    {metric}_mean = {mean},
+                    {metric}_m2 = greatest({metric}_sum2 - {metric}_sum * {mean}, 0),
+                    {metric}_m3 = {metric}_sum3 - 3 * {mean} * {metric}_sum2 + 3 * power({mean}, 2) * {metric}_sum
+                        - {n} * power({mean}, 3),
+                    {metric}_m4 = {metric}_sum4 - 4 * {mean} * {metric}_sum3 + 6 * power({mean}, 2) * {metric}_sum2
+                        - 4 * power({mean}, 3) * {metric}_sum + {n} * power({mean}, 4)
+                WHERE {n} > 0
+            """))
+            await connection.execute(text(
+                f"ALTER TABLE {table} "
+                + ", ".join(f"DROP COLUMN {metric}_{suffix}" for suffix in ("sum", "sum2", "sum3", "sum4"))
+            ))
+    logger.info(f"Агрегати {table} переведено на центральні моменти; для точних моментів старої історії "
+                f"її можна перебудувати: python -m services.rollup_service")
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Перебудова погодинних агрегатів measurement_hourly та скетчів квантилів")
+    parser.add_argument("--from", dest="time_from", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--to", dest="time_to", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    async with engine.begin() as connection:
+        rebuilt = await rebuild(connection, args.time_from, args.time_to)
+    logger.info(f"Перебудовано {rebuilt} погодинних агрегатів")
+    await close_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,56 +1,81 @@
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
+from Constants import DEVICE_MEASUREMENTS_PAGE_SIZE
 from models.esp import Device
 from models.room import Room
-from sсhemas.device import DeviceRead
+from services import statistics_cache
+from services.device_service import invalidate_devices, build_device_reads
 from sсhemas.room import RoomCreate, RoomRead
 
 
 
-def create_room(db: Session, room: RoomCreate):
-    existing_room = db.query(Room).filter(Room.name == room.name).first()
+async def create_room(db: AsyncSession, room: RoomCreate):
+    existing_room = (await db.execute(select(Room).where(Room.name == room.name))).scalars().first()
     if existing_room:
         raise HTTPException(400, f"Кімната з назвою '{room.name}' вже існує")
 
     devices = []
     for mac in room.device_macs:
-        device = db.query(Device).filter(Device.mac_address == mac).first()
+        device = (await db.execute(select(Device).where(Device.mac_address == mac))).scalars().first()
         if not device:
             raise HTTPException(status_code=404, detail=f"Пристрій з MAC-адресом {mac} не знайдено.")
         devices.append(device)
 
     db_room = Room(name=room.name)
     db.add(db_room)
-    db.flush()
+    await db.flush()
 
     for device in devices:
         device.room_id = db_room.id
 
-    db.commit()
-    db.refresh(db_room)
+    await db.commit()
+    await db.refresh(db_room, attribute_names=["devices"])
+    invalidate_devices(device.mac_address for device in devices)
+    statistics_cache.invalidate()
 
     return db_room
 
 
-def delete_room(db: Session, room_id: int):
-    db_room = db.query(Room).filter(Room.id == room_id).first()
+async def delete_room(db: AsyncSession, room_id: int):
+    result = await db.execute(select(Room).where(Room.id == room_id).options(selectinload(Room.devices)))
+    db_room = result.scalars().first()
     if db_room:
-        db.delete(db_room)
-        db.commit()
+        mac_addresses = [device.mac_address for device in db_room.devices]
+        await db.delete(db_room)
+        await db.commit()
+        invalidate_devices(mac_addresses)
+        statistics_cache.invalidate()
 
 
-def get_all_rooms(db: Session):
-    rooms = db.query(Room).options(
-        joinedload(Room.devices).joinedload(Device.measurements),
-        joinedload(Room.devices).joinedload(Device.configs)
-    ).all()
-    return [RoomRead.from_orm(room) for room in rooms]
+async def get_room_device_ids(db: AsyncSession, room_id: int) -> frozenset:
+    result = await db.execute(select(Device.id).where(Device.room_id == room_id))
+    return frozenset(result.scalars().all())
 
 
-def get_room_devices(db: Session, room_id: int):
-    devices = db.query(Device).filter(Device.room_id == room_id).options(
-        joinedload(Device.measurements),
-        joinedload(Device.configs)
-    ).all()
-    return [DeviceRead.from_orm(device) for device in devices]
+async def get_all_rooms(db: AsyncSession, include_measurements: bool = False,
+                        measurements_limit: int = DEVICE_MEASUREMENTS_PAGE_SIZE):
+    # selectinload замість ланцюжка joinedload: окремі запити для пристроїв і конфігурацій
+    # без декартового добутку рядків, а підсумки вимірювань — один запит на всі пристрої
+    result = await db.execute(select(Room).order_by(Room.id).options(
+        selectinload(Room.devices).selectinload(Device.configs)
+    ))
+    rooms = result.scalars().all()
+    devices = await build_device_reads(db, [device for room in rooms for device in room.devices],
+                                       include_measurements, measurements_limit)
+    devices_by_id = {device.id: device for device in devices}
+    return [
+        RoomRead(id=room.id, name=room.name, devices=[devices_by_id[device.id] for device in room.devices])
+        for room in rooms
+    ]
+
+
+async def get_room_devices(db: AsyncSession, room_id: int, include_measurements: bool = False,
+                           measurements_limit: int = DEVICE_MEASUREMENTS_PAGE_SIZE):
+    result = await db.execute(select(Device).where(Device.room_id == room_id).order_by(Device.id).options(
+        selectinload(Device.configs)
+    ))
+    devices = result.scalars().all()
+    return await build_device_reads(db, devices, include_measurements, measurements_limit)
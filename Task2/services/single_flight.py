@@ -0,0 +1,32 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    # Об'єднує однакові паралельні виклики: перший запускає обчислення, решта чекають на його результат.
+    # Обчислення захищене від скасування окремих очікувачів (наприклад, коли клієнт закрив вкладку),
+    # тому фабрика має відкривати власні ресурси, а не брати сесію з запиту
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.counters = {"calls": 0, "executed": 0, "coalesced": 0, "failed": 0, "in_flight": 0}
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        self.counters["in_flight"] = len(self._calls)
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["failed"] += 1
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.counters["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._done(key, finished))
+            self.counters["executed"] += 1
+            self.counters["in_flight"] = len(self._calls)
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,140 @@
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from models.measurement_sketch import MeasurementHourlySketch
+from services.quantile_sketch import QuantileSketch, MIN_INDEXABLE_VALUE
+from services.stats_math import METRICS, floor_hour, ceil_hour
+
+TABLE = MeasurementHourlySketch.__tablename__
+QUARTILES = (0.25, 0.5, 0.75)
+
+
+def _key_sql(value: str) -> str:
+    # Той самий індекс кошика, що й QuantileSketch.key
+    ln_gamma = QuantileSketch().ln_gamma
+    return f"""CASE WHEN abs({value}) < {MIN_INDEXABLE_VALUE!r} THEN 'z'
+        WHEN {value} > 0 THEN 'p' || ceil(ln({value}) / {ln_gamma!r})::bigint
+        ELSE 'n' || ceil(ln(-{value}) / {ln_gamma!r})::bigint END"""
+
+
+def _keyed_sql(where: str, room_id: Optional[int] = None) -> str:
+    # Кількість сирих значень у кожному кошику скетча по (пристрій, година, метрика)
+    values = ", ".join(f"('{metric}', m.{metric}::double precision)" for metric in METRICS)
+    room_filter = "AND m.device_id IN (SELECT id FROM devices WHERE room_id = :room_id)" if room_id else ""
+    return f"""
+        SELECT m.device_id, date_trunc('hour', m.timestamp) AS hour, v.metric, {_key_sql('v.x')} AS key,
+            count(*) AS count
+        FROM measurements m
+        CROSS JOIN LATERAL (VALUES {values}) v(metric, x)
+        WHERE m.device_id IS NOT NULL AND v.x IS NOT NULL AND ({where}) {room_filter}
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def _merge_sql(column: str) -> str:
+    return f"""(
+        SELECT coalesce(jsonb_object_agg(key, total), '{{}}'::jsonb)
+        FROM (
+            SELECT key, sum(value::bigint) AS total
+            FROM (
+                SELECT * FROM jsonb_each_text({TABLE}.{column})
+                UNION ALL
+                SELECT * FROM jsonb_each_text(EXCLUDED.{column})
+            ) parts
+            GROUP BY key
+        ) merged
+    )"""
+
+
+_upsert = text(f"""
+    INSERT INTO {TABLE} (device_id, hour, {', '.join(METRICS)})
+    VALUES (:device_id, :hour, {', '.join(f'CAST(:{metric} AS jsonb)' for metric in METRICS)})
+    ON CONFLICT (device_id, hour) DO UPDATE SET
+        {', '.join(f'{metric} = {_merge_sql(metric)}' for metric in METRICS)}
+""")
+
+
+def aggregate_rows(rows: List[Dict]) -> List[Dict]:
+    sketches = {}
+    for row in rows:
+        if row.get("device_id") is None:
+            continue
+        key = (row["device_id"], floor_hour(row["timestamp"]))
+        metric_sketches = sketches.get(key)
+        if metric_sketches is None:
+            metric_sketches = sketches[key] = {metric: QuantileSketch() for metric in METRICS}
+        for metric in METRICS:
+            if row.get(metric) is not None:
+                metric_sketches[metric].add(float(row[metric]))
+
+    return [
+        {"device_id": device_id, "hour": hour,
+         **{metric: json.dumps(sketches[(device_id, hour)][metric].bins) for metric in METRICS}}
+        for device_id, hour in sorted(sketches)
+    ]
+
+
+async def apply(executor, sketches: List[Dict]):
+    # Викликається в тій самій транзакції, що й rollup_service.apply_aggregates, з результатом aggregate_rows
+    if sketches:
+        await executor.execute(_upsert, sketches)
+
+
+async def rebuild(connection, where: str, hour_where: str, params: Dict):
+    await connection.execute(text(f"DELETE FROM {TABLE} WHERE {hour_where}"), params)
+    sketches = ", ".join(
+        f"coalesce(jsonb_object_agg(key, count) FILTER (WHERE metric = '{metric}'), '{{}}'::jsonb)"
+        for metric in METRICS
+    )
+    await connection.execute(
+        text(f"INSERT INTO {TABLE} (device_id, hour, {', '.join(METRICS)}) "
+             f"SELECT device_id, hour, {sketches} FROM ({_keyed_sql(where)}) k GROUP BY device_id, hour"),
+        params
+    )
+
+
+async def get_quartiles(db, time_from: datetime, time_to: datetime,
+                        room_id: Optional[int] = None) -> Dict[int, Dict[str, List[Optional[float]]]]:
+    # Кошики погодинних скетчів зливає PostgreSQL; неповні години на краях вікна додаються із сирих рядків
+    inner_from, inner_to = ceil_hour(time_from), floor_hour(time_to)
+    params = {"time_from": time_from, "time_to": time_to}
+    if room_id:
+        params["room_id"] = room_id
+
+    parts = []
+    if inner_from < inner_to:
+        params.update({"inner_from": inner_from, "inner_to": inner_to})
+        sketches = ", ".join(f"('{metric}', s.{metric})" for metric in METRICS)
+        room_filter = "AND s.device_id IN (SELECT id FROM devices WHERE room_id = :room_id)" if room_id else ""
+        parts.append(f"""
+            SELECT s.device_id, v.metric, b.key, b.value::bigint AS count
+            FROM {TABLE} s
+            CROSS JOIN LATERAL (VALUES {sketches}) v(metric, sketch)
+            CROSS JOIN LATERAL jsonb_each_text(v.sketch) b
+            WHERE s.hour >= :inner_from AND s.hour < :inner_to {room_filter}
+        """)
+        edges = "(m.timestamp >= :time_from AND m.timestamp < :inner_from) " \
+                "OR (m.timestamp >= :inner_to AND m.timestamp <= :time_to)"
+    else:
+        edges = "m.timestamp BETWEEN :time_from AND :time_to"
+    parts.append(f"SELECT device_id, metric, key, count FROM ({_keyed_sql(edges, room_id)}) e")
+
+    result = await db.execute(
+        text(f"SELECT device_id, metric, key, sum(count) AS count FROM ({' UNION ALL '.join(parts)}) p "
+             f"GROUP BY device_id, metric, key"),
+        params
+    )
+    bins: Dict[int, Dict[str, Dict[str, int]]] = {}
+    for row in result:
+        bins.setdefault(row.device_id, {}).setdefault(row.metric, {})[row.key] = int(row.count)
+
+    return {
+        device_id: {
+            metric: QuantileSketch(bins=metric_bins[metric]).quantiles(QUARTILES) if metric in metric_bins else None
+            for metric in METRICS
+        }
+        for device_id, metric_bins in bins.items()
+    }
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.stats_math import METRICS, build_parameter_stats, trend_stats
+from sсhemas.analytics import StatisticsOutput
+
+
+def _scope_sql(room_id: Optional[int]) -> str:
+    metrics = ", ".join(f"m.{metric}::double precision AS {metric}" for metric in METRICS)
+    room_join = "JOIN devices d ON d.id = m.device_id AND d.room_id = :room_id" if room_id else ""
+    return f"""
+        SELECT m.device_id, m.timestamp, {metrics}
+        FROM measurements m {room_join}
+        WHERE m.timestamp BETWEEN :time_from AND :time_to
+    """
+
+
+def _summary_sql(room_id: Optional[int]) -> str:
+    means = ", ".join(f"avg({metric}) AS {metric}_mean" for metric in METRICS)
+    aggregates = ",\n".join(
+        f"""count(s.{metric}) AS {metric}_count,
+            avg(s.{metric}) AS {metric}_mean,
+            stddev_samp(s.{metric}) AS {metric}_std,
+            min(s.{metric}) AS {metric}_min,
+            max(s.{metric}) AS {metric}_max,
+            percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY s.{metric}) AS {metric}_quartiles,
+            sum(power(s.{metric} - mn.{metric}_mean, 2)) AS {metric}_m2,
+            sum(power(s.{metric} - mn.{metric}_mean, 3)) AS {metric}_m3,
+            sum(power(s.{metric} - mn.{metric}_mean, 4)) AS {metric}_m4"""
+        for metric in METRICS
+    )
+    return f"""
+        WITH scoped AS ({_scope_sql(room_id)}),
+        means AS (SELECT device_id, {means} FROM scoped GROUP BY device_id)
+        SELECT s.device_id, min(s.timestamp) AS start_time, max(s.timestamp) AS end_time,
+            {aggregates}
+        FROM scoped s JOIN means mn ON mn.device_id = s.device_id
+        GROUP BY s.device_id
+        ORDER BY s.device_id
+    """
+
+
+def _trends_sql(room_id: Optional[int]) -> str:
+    means = ", ".join(f"avg({metric}) AS {metric}" for metric in METRICS)
+    return f"""
+        SELECT device_id, date_trunc(:granularity, timestamp) AS bucket, {means}
+        FROM ({_scope_sql(room_id)}) s
+        GROUP BY device_id, bucket
+        ORDER BY device_id, bucket
+    """
+
+
+def _quartiles_sql(room_id: Optional[int]) -> str:
+    quartiles = ", ".join(
+        f"percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY {metric}) AS {metric}_quartiles"
+        for metric in METRICS
+    )
+    return f"SELECT device_id, {quartiles} FROM ({_scope_sql(room_id)}) s GROUP BY device_id"
+
+
+async def get_quartiles(db: AsyncSession, time_from: datetime, time_to: datetime,
+                        room_id: Optional[int] = None) -> Dict[int, Dict[str, List[Optional[float]]]]:
+    params = {"time_from": time_from, "time_to": time_to}
+    if room_id:
+        params["room_id"] = room_id
+    result = await db.execute(text(_quartiles_sql(room_id)), params)
+    return {
+        row["device_id"]: {metric: row[f"{metric}_quartiles"] for metric in METRICS}
+        for row in result.mappings()
+    }
+
+
+async def get_trend_buckets(db: AsyncSession, time_from: datetime, time_to: datetime, room_id: Optional[int] = None,
+                            granularity: str = "hour") -> Dict[int, List]:
+    params = {"time_from": time_from, "time_to": time_to, "granularity": granularity}
+    if room_id:
+        params["room_id"] = room_id
+    buckets = {}
+    for row in (await db.execute(text(_trends_sql(room_id)), params)).mappings():
+        buckets.setdefault(row["device_id"], []).append(
+            (row["bucket"], {metric: row[metric] for metric in METRICS})
+        )
+    return buckets
+
+
+async def get_statistics(db: AsyncSession, time_from: datetime, time_to: datetime, room_id: Optional[int] = None,
+                         granularity: str = "hour", max_points: Optional[int] = None) -> List[StatisticsOutput]:
+    # Усі агрегати рахує PostgreSQL, клієнту передаються лише підсумкові значення
+    params = {"time_from": time_from, "time_to": time_to}
+    if room_id:
+        params["room_id"] = room_id
+
+    summary = (await db.execute(text(_summary_sql(room_id)), params)).mappings().all()
+    if not summary:
+        return []
+
+    buckets = await get_trend_buckets(db, time_from, time_to, room_id, granularity)
+
+    device_stats = []
+    for row in summary:
+        stats = {
+            metric: build_parameter_stats(
+                row[f"{metric}_count"], row[f"{metric}_mean"], row[f"{metric}_std"], row[f"{metric}_min"],
+                row[f"{metric}_max"], row[f"{metric}_quartiles"], row[f"{metric}_m2"], row[f"{metric}_m3"],
+                row[f"{metric}_m4"]
+            )
+            for metric in METRICS
+        }
+        start_time, end_time = row["start_time"], row["end_time"]
+        stats["time_stats"] = {
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat(),
+            'duration': (end_time - start_time).total_seconds() / 3600,
+            **trend_stats(buckets.get(row["device_id"], []), granularity, max_points)
+        }
+        device_stats.append(StatisticsOutput(device_id=f'device_{row["device_id"]}', **stats))
+
+    return device_stats
@@ -0,0 +1,159 @@
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import count
+from typing import Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+from Constants import STATS_CACHE_MAX_BYTES, STATS_CACHE_LIVE_TTL_SECONDS, STATS_CACHE_EVENT_LOG_SIZE
+from time_utils import to_naive_utc
+
+# Оцінка накладних витрат на один запис поза самим тілом відповіді
+ENTRY_OVERHEAD_BYTES = 512
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    time_from: datetime
+    time_to: datetime
+    devices: Optional[FrozenSet[int]]
+    expires_at: Optional[float]
+    order: int
+
+
+# Кеш серіалізованих відповідей /statistics у пам'яті процесу. Запис видаляється лише тоді, коли
+# нове вимірювання пристрою з його області потрапляє у вікно [time_from, time_to]; вікна, що повністю
+# в минулому, живуть до витіснення LRU, а вікна, що сягають теперішнього часу, мають ще й TTL —
+# на випадок записів з інших процесів
+_entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+# (time_to, order, key), відсортовано за time_to: вимірювання з часом t зачіпає лише записи з time_to >= t
+_by_end: List[Tuple[datetime, int, Hashable]] = []
+_size = 0
+_order = count()
+
+# Журнал останніх прийомів вимірювань: (seq, {device_id: (min_timestamp, max_timestamp)})
+_events: deque = deque(maxlen=STATS_CACHE_EVENT_LOG_SIZE)
+_seq = 0
+# Найпізніший час вимірювання, прийнятого для кожного пристрою
+watermarks: Dict[int, datetime] = {}
+
+counters = {"hits": 0, "misses": 0, "stored": 0, "invalidated": 0, "evicted": 0, "discarded": 0}
+
+
+def make_key(time_from: datetime, time_to: datetime, room_id: Optional[int], aggregation: str,
+             quantiles: str, granularity: str, max_points: Optional[int]) -> Hashable:
+    return to_naive_utc(time_from), to_naive_utc(time_to), room_id, aggregation, quantiles, granularity, max_points
+
+
+def begin() -> int:
+    # Номер останнього прийому перед початком обчислення; передається в put
+    return _seq
+
+
+def _remove(key: Hashable) -> Optional[_Entry]:
+    global _size
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        index = bisect_left(_by_end, (entry.time_to, entry.order))
+        del _by_end[index]
+        _size -= len(entry.body) + ENTRY_OVERHEAD_BYTES
+    return entry
+
+
+def get(key: Hashable) -> Optional[bytes]:
+    entry = _entries.get(key)
+    if entry is not None and entry.expires_at is not None and entry.expires_at < time.monotonic():
+        _remove(key)
+        entry = None
+    if entry is None:
+        counters["misses"] += 1
+        return None
+    _entries.move_to_end(key)
+    counters["hits"] += 1
+    return entry.body
+
+
+def _touches(spans: Dict[int, Tuple[datetime, datetime]], time_from: datetime, time_to: datetime,
+             devices: Optional[FrozenSet[int]]) -> bool:
+    return any(
+        (devices is None or device_id in devices) and time_from <= last and first <= time_to
+        for device_id, (first, last) in spans.items()
+    )
+
+
+def put(key: Hashable, body: bytes, time_from: datetime, time_to: datetime,
+        devices: Optional[FrozenSet[int]], started_seq: int) -> bool:
+    global _size
+    time_from, time_to = to_naive_utc(time_from), to_naive_utc(time_to)
+    size = len(body) + ENTRY_OVERHEAD_BYTES
+    if size > STATS_CACHE_MAX_BYTES:
+        return False
+
+    # Якщо під час обчислення у вікно потрапили нові вимірювання, результат уже застарів
+    if _seq != started_seq:
+        if not _events or _events[0][0] > started_seq + 1:
+            counters["discarded"] += 1
+            return False
+        for seq, spans in _events:
+            if seq > started_seq and _touches(spans, time_from, time_to, devices):
+                counters["discarded"] += 1
+                return False
+
+    _remove(key)
+    live = time_to >= datetime.utcnow()
+    entry = _Entry(body=body, time_from=time_from, time_to=time_to, devices=devices,
+                   expires_at=time.monotonic() + STATS_CACHE_LIVE_TTL_SECONDS if live else None,
+                   order=next(_order))
+    _entries[key] = entry
+    insort(_by_end, (time_to, entry.order, key))
+    _size += size
+    counters["stored"] += 1
+
+    while _size > STATS_CACHE_MAX_BYTES:
+        _remove(next(iter(_entries)))
+        counters["evicted"] += 1
+    return True
+
+
+def record_ingest(rows: List[Dict]):
+    global _seq
+    spans: Dict[int, Tuple[datetime, datetime]] = {}
+    for row in rows:
+        device_id, timestamp = row.get("device_id"), row.get("timestamp")
+        if device_id is None or timestamp is None:
+            continue
+        timestamp = to_naive_utc(timestamp)
+        first, last = spans.get(device_id, (timestamp, timestamp))
+        spans[device_id] = (min(first, timestamp), max(last, timestamp))
+    if not spans:
+        return
+
+    _seq += 1
+    _events.append((_seq, spans))
+    for device_id, (_, last) in spans.items():
+        if device_id not in watermarks or watermarks[device_id] < last:
+            watermarks[device_id] = last
+
+    earliest = min(first for first, _ in spans.values())
+    stale = [
+        key for _, _, key in _by_end[bisect_left(_by_end, (earliest,)):]
+        if _touches(spans, _entries[key].time_from, _entries[key].time_to, _entries[key].devices)
+    ]
+    for key in stale:
+        _remove(key)
+    counters["invalidated"] += len(stale)
+
+
+def invalidate():
+    # Повне скидання — після змін складу кімнат або видалення пристроїв
+    global _size
+    counters["invalidated"] += len(_entries)
+    _entries.clear()
+    _by_end.clear()
+    _size = 0
+
+
+def info() -> Dict:
+    return {**counters, "entries": len(_entries), "bytes": _size, "ingest_seq": _seq}
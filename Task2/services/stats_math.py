@@ -0,0 +1,156 @@
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+METRICS = ("temperature", "humidity", "co2", "productivity")
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(value: datetime) -> datetime:
+    floored = floor_hour(value)
+    return floored if floored == value else floored + timedelta(hours=1)
+
+
+def finite(value: Optional[float]) -> Optional[float]:
+    if value is None or math.isnan(value) or math.isinf(value):
+        return None
+    return float(value)
+
+
+# Формули скошеності та ексцесу збігаються з pandas (Series.skew / Series.kurtosis);
+# m2, m3, m4 — суми центральних степенів відхилень від середнього
+def skewness_from_moments(n: float, m2: float, m3: float) -> float:
+    if n < 3:
+        return math.nan
+    if m2 == 0:
+        return 0.0
+    return n * (n - 1) ** 0.5 / (n - 2) * (m3 / m2 ** 1.5)
+
+
+def kurtosis_from_moments(n: float, m2: float, m4: float) -> float:
+    if n < 4:
+        return math.nan
+    if m2 == 0:
+        return 0.0
+    adjustment = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+    return n * (n + 1) * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 ** 2) - adjustment
+
+
+def merge_moments(a: Tuple[float, float, float, float, float],
+                  b: Tuple[float, float, float, float, float]) -> Tuple[float, float, float, float, float]:
+    # Об'єднання (n, mean, m2, m3, m4) двох частин вибірки (Pébay, 2008) — узагальнення алгоритму Велфорда
+    # на блоки рядків, тож статистика рахується за один прохід без зберігання значень
+    n_a, mean_a, m2_a, m3_a, m4_a = a
+    n_b, mean_b, m2_b, m3_b, m4_b = b
+    if not n_a:
+        return b
+    if not n_b:
+        return a
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * n_b / n
+    m2 = m2_a + m2_b + delta ** 2 * n_a * n_b / n
+    m3 = (m3_a + m3_b + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+          + 3 * delta * (n_a * m2_b - n_b * m2_a) / n)
+    m4 = (m4_a + m4_b + delta ** 4 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2) / n ** 3
+          + 6 * delta ** 2 * (n_a ** 2 * m2_b + n_b ** 2 * m2_a) / n ** 2
+          + 4 * delta * (n_a * m3_b - n_b * m3_a) / n)
+    return n, mean, m2, m3, m4
+
+
+def build_parameter_stats(count: float, mean: Optional[float], std: Optional[float], minimum: Optional[float],
+                          maximum: Optional[float], quartiles: Optional[Sequence[Optional[float]]],
+                          m2: Optional[float], m3: Optional[float], m4: Optional[float]) -> Dict:
+    if not count:
+        return {'mean': None, 'median': None, 'std': None, 'min': None, 'max': None,
+                'quartiles': [None, None, None], 'iqr': None, 'skewness': None, 'kurtosis': None}
+
+    quartiles = [finite(q) for q in quartiles] if quartiles else [None, None, None]
+    iqr = quartiles[2] - quartiles[0] if quartiles[0] is not None and quartiles[2] is not None else None
+    return {
+        'mean': finite(mean),
+        'median': quartiles[1],
+        'std': finite(std) if count > 1 else None,
+        'min': finite(minimum),
+        'max': finite(maximum),
+        'quartiles': quartiles,
+        'iqr': iqr,
+        'skewness': finite(skewness_from_moments(count, m2, m3)),
+        'kurtosis': finite(kurtosis_from_moments(count, m2, m4))
+    }
+
+
+GRANULARITY_STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+
+def lttb(points: List[Tuple[float, float]], threshold: int) -> List[int]:
+    # Largest-Triangle-Three-Buckets: індекси точок, що найкраще зберігають форму ряду
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    selected = [0]
+    every = (count - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int(math.floor((i + 1) * every)) + 1
+        avg_end = min(int(math.floor((i + 2) * every)) + 1, count)
+        avg_x = sum(x for x, _ in points[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y for _, y in points[avg_start:avg_end]) / (avg_end - avg_start)
+
+        range_start = int(math.floor(i * every)) + 1
+        range_end = int(math.floor((i + 1) * every)) + 1
+        ax, ay = points[a]
+        best, best_area = range_start, -1.0
+        for index in range(range_start, range_end):
+            x, y = points[index]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = index, area
+        selected.append(best)
+        a = best
+    selected.append(count - 1)
+    return selected
+
+
+def trend_stats(buckets: List[Tuple[datetime, Dict[str, Optional[float]]]], granularity: str = "hour",
+                max_points: Optional[int] = None) -> Dict:
+    # Середні за інтервалами з пропусками для інтервалів без вимірювань, як у DataFrame.resample(...).mean().
+    # Якщо точок більше за max_points, кожна метрика проріджується LTTB, а в ряд потрапляє
+    # об'єднання вибраних моментів, щоб значення всіх метрик лишалися вирівняними за часом
+    trends = {metric: [] for metric in METRICS}
+    timestamps = []
+    if buckets:
+        values = dict(buckets)
+        step = GRANULARITY_STEPS[granularity]
+        bucket, last_bucket = buckets[0][0], buckets[-1][0]
+        while bucket <= last_bucket:
+            means = values.get(bucket, {})
+            for metric in METRICS:
+                trends[metric].append(finite(means.get(metric)))
+            timestamps.append(bucket)
+            bucket += step
+
+    if max_points and len(timestamps) > max_points:
+        series = {
+            metric: [(index, value) for index, value in enumerate(trends[metric]) if value is not None]
+            for metric in METRICS
+        }
+        series = {metric: points for metric, points in series.items() if points}
+        budget = max(3, max_points // max(len(series), 1))
+        keep = set()
+        for points in series.values():
+            keep.update(points[index][0] for index in lttb(points, budget))
+        keep = sorted(keep)[:max_points]
+        trends = {metric: [metric_values[index] for index in keep] for metric, metric_values in trends.items()}
+        timestamps = [timestamps[index] for index in keep]
+
+    return {'hourly_trends': trends, 'trend_timestamps': timestamps, 'granularity': granularity}
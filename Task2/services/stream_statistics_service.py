@@ -0,0 +1,168 @@
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from Constants import STATS_STREAM_CHUNK_ROWS
+from models.esp import Device
+from models.measurement import Measurement
+from services import sql_statistics_service
+from services.quantile_sketch import QuantileSketch
+from services.stats_math import METRICS, build_parameter_stats, trend_stats, merge_moments
+from sсhemas.analytics import StatisticsOutput
+
+QUARTILES = (0.25, 0.5, 0.75)
+PANDAS_FREQUENCIES = {"minute": "min", "hour": "h", "day": "D"}
+
+
+@dataclass
+class MetricAccumulator:
+    moments: tuple = (0, 0.0, 0.0, 0.0, 0.0)
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    sketch: Optional[QuantileSketch] = None
+
+
+@dataclass
+class DeviceAccumulator:
+    metrics: Dict[str, MetricAccumulator]
+    first_timestamp: Optional[datetime] = None
+    last_timestamp: Optional[datetime] = None
+    # початок інтервалу тренду -> метрика -> [сума, кількість]
+    buckets: Dict[datetime, Dict[str, List[float]]] = field(default_factory=dict)
+
+
+class StreamingStatistics:
+    # Стан займає O(пристрої × інтервали тренду) незалежно від кількості рядків: кожен блок зводиться
+    # до моментів, мін/макс і сум за інтервалами тренду, після чого відкидається
+
+    def __init__(self, approximate_quantiles: bool = False, granularity: str = "hour",
+                 max_points: Optional[int] = None):
+        self.approximate_quantiles = approximate_quantiles
+        self.granularity = granularity
+        self.max_points = max_points
+        self.devices: Dict[int, DeviceAccumulator] = {}
+
+    def _device(self, device_id: int) -> DeviceAccumulator:
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = DeviceAccumulator(metrics={
+                metric: MetricAccumulator(sketch=QuantileSketch() if self.approximate_quantiles else None)
+                for metric in METRICS
+            })
+        return device
+
+    def consume(self, rows: List, columns: List[str]):
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        df = df[df['device_id'].notna()]
+        if df.empty:
+            return
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        if self.granularity == "week":
+            days = df['timestamp'].dt.floor('D')
+            df['bucket'] = days - pd.to_timedelta(days.dt.weekday, unit='D')
+        else:
+            df['bucket'] = df['timestamp'].dt.floor(PANDAS_FREQUENCIES[self.granularity])
+        for metric in METRICS:
+            df[metric] = pd.to_numeric(df[metric], errors='coerce').astype(float)
+
+        by_device = df.groupby('device_id')
+        timestamps = by_device['timestamp'].agg(['min', 'max'])
+        for device_id, row in timestamps.iterrows():
+            device = self._device(int(device_id))
+            first, last = row['min'].to_pydatetime(), row['max'].to_pydatetime()
+            device.first_timestamp = first if device.first_timestamp is None else min(device.first_timestamp, first)
+            device.last_timestamp = last if device.last_timestamp is None else max(device.last_timestamp, last)
+
+        for metric in METRICS:
+            values = by_device[metric]
+            deviations = df[metric] - values.transform('mean')
+            chunk = pd.DataFrame({
+                'count': values.count(),
+                'mean': values.mean(),
+                'm2': (deviations ** 2).groupby(df['device_id']).sum(),
+                'm3': (deviations ** 3).groupby(df['device_id']).sum(),
+                'm4': (deviations ** 4).groupby(df['device_id']).sum(),
+                'min': values.min(),
+                'max': values.max(),
+            })
+            for device_id, row in chunk[chunk['count'] > 0].iterrows():
+                accumulator = self._device(int(device_id)).metrics[metric]
+                accumulator.moments = merge_moments(
+                    accumulator.moments, (int(row['count']), row['mean'], row['m2'], row['m3'], row['m4'])
+                )
+                accumulator.minimum = row['min'] if accumulator.minimum is None else min(accumulator.minimum, row['min'])
+                accumulator.maximum = row['max'] if accumulator.maximum is None else max(accumulator.maximum, row['max'])
+            if self.approximate_quantiles:
+                for device_id, device_values in values:
+                    self._device(int(device_id)).metrics[metric].sketch.update_array(device_values.to_numpy())
+
+        trends = df.groupby(['device_id', 'bucket'])[list(METRICS)].agg(['sum', 'count'])
+        for (device_id, start), row in trends.iterrows():
+            bucket = self._device(int(device_id)).buckets.setdefault(
+                start.to_pydatetime(), {metric: [0.0, 0] for metric in METRICS}
+            )
+            for metric in METRICS:
+                bucket[metric][0] += row[(metric, 'sum')]
+                bucket[metric][1] += int(row[(metric, 'count')])
+
+    def results(self, quartiles: Dict[int, Dict[str, List[Optional[float]]]]) -> List[StatisticsOutput]:
+        device_stats = []
+        for device_id in sorted(self.devices):
+            device = self.devices[device_id]
+            stats = {}
+            for metric, accumulator in device.metrics.items():
+                count, mean, m2, m3, m4 = accumulator.moments
+                std = math.sqrt(m2 / (count - 1)) if count > 1 else None
+                if accumulator.sketch is not None:
+                    metric_quartiles = accumulator.sketch.quantiles(QUARTILES) if count else None
+                else:
+                    metric_quartiles = quartiles.get(device_id, {}).get(metric)
+                stats[metric] = build_parameter_stats(
+                    count, mean if count else None, std, accumulator.minimum, accumulator.maximum,
+                    metric_quartiles, m2, m3, m4
+                )
+
+            start_time, end_time = device.first_timestamp, device.last_timestamp
+            stats["time_stats"] = {
+                'start_time': start_time.isoformat(),
+                'end_time': end_time.isoformat(),
+                'duration': (end_time - start_time).total_seconds() / 3600,
+                **trend_stats([
+                    (start, {metric: total / count if count else None
+                             for metric, (total, count) in device.buckets[start].items()})
+                    for start in sorted(device.buckets)
+                ], self.granularity, self.max_points)
+            }
+            device_stats.append(StatisticsOutput(device_id=f'device_{device_id}', **stats))
+        return device_stats
+
+
+async def get_statistics(db: AsyncSession, time_from: datetime, time_to: datetime, room_id: Optional[int] = None,
+                         quantiles: str = "exact", granularity: str = "hour",
+                         max_points: Optional[int] = None) -> List[StatisticsOutput]:
+    # Рядки читаються серверним курсором блоками по STATS_STREAM_CHUNK_ROWS; точні квартилі
+    # рахує PostgreSQL, наближені — скетчі, що накопичуються разом з моментами
+    query = select(Measurement.__table__).where(Measurement.timestamp.between(time_from, time_to))
+    if room_id:
+        query = query.join(Device).where(Device.room_id == room_id)
+
+    statistics = StreamingStatistics(approximate_quantiles=quantiles == "approx", granularity=granularity,
+                                     max_points=max_points)
+    result = await db.stream(query.execution_options(yield_per=STATS_STREAM_CHUNK_ROWS))
+    columns = list(result.keys())
+    async for rows in result.partitions():
+        await run_in_threadpool(statistics.consume, rows, columns)
+
+    if not statistics.devices:
+        return []
+
+    exact_quartiles = {}
+    if quantiles != "approx":
+        exact_quartiles = await sql_statistics_service.get_quartiles(db, time_from, time_to, room_id)
+    return await run_in_threadpool(statistics.results, exact_quartiles)
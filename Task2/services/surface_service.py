@@ -0,0 +1,122 @@
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from Constants import SURFACE_MAX_GRID_POINTS, SURFACE_MAX_RESPONSE_POINTS, SURFACE_DEFAULT_AXIS_POINTS
+from services import config_service, device_service, room_service
+from services.productivity import ProductivityEvaluator
+from sсhemas.analytics import AxisRange, SurfaceInput
+
+AXES = ("temperature", "humidity", "co2")
+
+
+def _axis_size(axis: Optional[AxisRange]) -> int:
+    if axis is None:
+        return SURFACE_DEFAULT_AXIS_POINTS
+    if axis.step is not None:
+        # Допуск на похибку ділення, щоб stop, кратний кроку, потрапив у сітку.
+        # Дуже малий крок дає нескінченну кількість інтервалів — її перевіряємо до int()
+        intervals = (axis.stop - axis.start) / axis.step + 1e-9
+        if not math.isfinite(intervals) or intervals >= SURFACE_MAX_GRID_POINTS:
+            raise ValueError(f"Крок {axis.step} дає більше {SURFACE_MAX_GRID_POINTS} точок на осі")
+        return int(math.floor(intervals)) + 1
+    return axis.points or SURFACE_DEFAULT_AXIS_POINTS
+
+
+def _axis_values(axis: Optional[AxisRange], low: float, high: float) -> np.ndarray:
+    # Без явного діапазону вісь охоплює допустимий діапазон конфігурації
+    if axis is None:
+        return np.linspace(low, high, SURFACE_DEFAULT_AXIS_POINTS)
+    if axis.step is not None:
+        return axis.start + np.arange(_axis_size(axis)) * axis.step
+    return np.linspace(axis.start, axis.stop, _axis_size(axis))
+
+
+async def resolve_evaluators(db: AsyncSession, input_data: SurfaceInput) -> List[ProductivityEvaluator]:
+    if input_data.config is not None:
+        return [ProductivityEvaluator.from_config(input_data.config.dict())]
+    if input_data.mac_address is not None:
+        device = await device_service.resolve_device(db, input_data.mac_address)
+        try:
+            return [(await config_service.get_cached_config(db, device.id)).evaluator]
+        except ValueError:
+            raise ValueError(f"Конфігурацію для пристрою з MAC-адресою {input_data.mac_address} не знайдено")
+
+    device_ids = await room_service.get_room_device_ids(db, input_data.room_id)
+    entries = await config_service.get_cached_configs(db, device_ids)
+    if not entries:
+        raise ValueError(f"У кімнаті з ID {input_data.room_id} немає пристроїв з конфігурацією")
+    return [entry.evaluator for entry in entries.values()]
+
+
+def compute_surface(evaluators: List[ProductivityEvaluator], input_data: SurfaceInput) -> Dict:
+    # Пристрої кімнати часто мають однакові конфігурації: кожна різна оцінюється один раз
+    # і входить у середнє з вагою кількості пристроїв. Ліміт сітки ділиться між різними
+    # конфігураціями, бо вартість обчислення — сітка × їх кількість
+    weights = Counter(evaluators)
+    limit = SURFACE_MAX_GRID_POINTS // len(weights)
+    sizes = [_axis_size(getattr(input_data, name)) for name in AXES]
+    total = math.prod(sizes)
+    if total > limit:
+        raise ValueError(f"Сітка з {total} точок для {len(weights)} різних конфігурацій перевищує ліміт {limit}")
+    returned = total // sizes[AXES.index(input_data.slice_axis)] if input_data.slice_axis else total
+    if returned > SURFACE_MAX_RESPONSE_POINTS:
+        raise ValueError(f"Поверхня з {returned} точок завелика для відповіді (ліміт {SURFACE_MAX_RESPONSE_POINTS}); "
+                         f"вкажіть slice_axis або зменшіть кількість точок")
+
+    axes = {
+        name: _axis_values(
+            getattr(input_data, name),
+            float(np.min([getattr(evaluator, f"{name}_min") for evaluator in weights])),
+            float(np.max([getattr(evaluator, f"{name}_max") for evaluator in weights])),
+        )
+        for name in AXES
+    }
+
+    # Осі форми (n,1,1), (1,m,1), (1,1,k): broadcasting розгортає їх у повну сітку лише на добутку оцінок.
+    # Для кімнати поверхня — середня продуктивність за конфігураціями її пристроїв
+    temperature = axes["temperature"][:, None, None]
+    humidity = axes["humidity"][None, :, None]
+    co2 = axes["co2"][None, None, :]
+    surface = None
+    for evaluator, count in weights.items():
+        part = evaluator.overall_array(temperature, humidity, co2)
+        if count > 1:
+            part *= count
+        if surface is None:
+            surface = part
+        else:
+            surface += part
+    if len(evaluators) > 1:
+        surface /= len(evaluators)
+
+    optimum_index = np.unravel_index(np.argmax(surface), surface.shape)
+    optimum = {name: float(axes[name][index]) for name, index in zip(AXES, optimum_index)}
+    optimum["productivity"] = round(float(surface[optimum_index]), 2)
+
+    dimensions = list(AXES)
+    fixed = None
+    if input_data.slice_axis:
+        position = AXES.index(input_data.slice_axis)
+        index = int(np.argmin(np.abs(axes[input_data.slice_axis] - input_data.slice_value)))
+        surface = np.take(surface, index, axis=position)
+        fixed = {input_data.slice_axis: float(axes[input_data.slice_axis][index])}
+        dimensions.pop(position)
+
+    return {
+        "axes": {name: values.tolist() for name, values in axes.items()},
+        "dimensions": dimensions,
+        "surface": np.round(surface).astype(int).tolist(),
+        "fixed": fixed,
+        "optimum": optimum,
+        "points": total,
+    }
+
+
+async def get_surface(db: AsyncSession, input_data: SurfaceInput) -> Dict:
+    evaluators = await resolve_evaluators(db, input_data)
+    return await run_in_threadpool(compute_surface, evaluators, input_data)
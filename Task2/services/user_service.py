@@ -1,82 +1,99 @@
-from datetime import timedelta
 from fastapi import HTTPException, status
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from get_db import engine
 from models.user import User
 
-from auth import authenticate_user, get_password_hash, verify_password, create_access_token
+from auth import AuthUser, authenticate_user, get_password_hash, verify_password, create_user_token, invalidate_user
 
-from Constants import ACCESS_TOKEN_EXPIRE_MINUTES
 
-
-def register_user(db: Session, username: str, password: str, role: str = "manager"):
-    existing_user = db.query(User).filter(User.username == username).first()
+async def register_user(db: AsyncSession, username: str, password: str, role: str = "manager"):
+    existing_user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Користувач з таким ім'ям вже існує")
 
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash(password)
     new_user = User(username=username, password_hash=hashed_password, role=role)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 
-def login(db: Session, username: str, password: str):
-    user = authenticate_user(db, username, password)
+async def login(db: AsyncSession, username: str, password: str):
+    user = await authenticate_user(db, username, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неправильне ім'я користувача або пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": create_user_token(user), "token_type": "bearer"}
+
+
+def _revoke_tokens(user: User):
+    user.token_version = (user.token_version or 0) + 1
 
 
-def change_password(db: Session, user: User, old_password: str, new_password: str):
-    if not verify_password(old_password, user.password_hash):
+async def change_password(db: AsyncSession, current_user: AuthUser, old_password: str, new_password: str) -> str:
+    user = await db.get(User, current_user.id)
+    if not user or not await verify_password(old_password, user.password_hash):
         raise HTTPException(status_code=400, detail="Не вірний старий пароль")
 
-    user.password_hash = get_password_hash(new_password)
-    db.commit()
+    user.password_hash = await get_password_hash(new_password)
+    _revoke_tokens(user)
+    await db.commit()
+    invalidate_user(user.username, user.token_version)
+    # Попередні токени відкликано, тож поточний сеанс отримує новий
+    return create_user_token(user)
 
 
-def ban_user(db: Session, username: str):
-    user = db.query(User).filter(User.username == username).first()
+async def ban_user(db: AsyncSession, username: str):
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="Користувача не знайдено")
     user.is_banned = True
-    db.commit()
+    _revoke_tokens(user)
+    await db.commit()
+    invalidate_user(username, user.token_version)
 
 
-def unban_user(db: Session, username: str):
-    user = db.query(User).filter(User.username == username).first()
+async def unban_user(db: AsyncSession, username: str):
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="Користувача не знайдено")
     user.is_banned = False
-    db.commit()
+    await db.commit()
+    invalidate_user(username)
 
 
-def change_role(db: Session, username: str, role: str):
-    user = db.query(User).filter(User.username == username).first()
+async def change_role(db: AsyncSession, username: str, role: str):
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="Користувача не знайдено")
     if role not in ['manager', 'admin']:
         raise HTTPException(status_code=400, detail="Неправильна роль")
     if user.role == 'manager' and role == 'admin':
         user.role = role
-        db.commit()
+        _revoke_tokens(user)
+        await db.commit()
+        invalidate_user(username, user.token_version)
     elif user.role == 'admin' and role == 'manager':
         raise HTTPException(status_code=400, detail="Неможливо понизити адміністратора до менеджера")
     else:
         raise HTTPException(status_code=400, detail="Неможливо змінити роль")
 
 
-def get_all_users(db: Session):
-    return db.query(User).all()
+async def get_all_users(db: AsyncSession):
+    return (await db.execute(select(User))).scalars().all()
+
+
+async def prepare():
+    # create_all не додає нові колонки до вже існуючої таблиці
+    async with engine.begin() as connection:
+        await connection.execute(text(
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version integer NOT NULL DEFAULT 0"
+        ))
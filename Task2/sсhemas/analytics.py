@@ -1,6 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator, model_validator
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
+
+from Constants import PREDICT_BATCH_MAX_SIZE, TRENDS_MAX_POINTS_LIMIT
+from time_utils import to_naive_utc
+from .config import ConfigImport
 
 
 class PredictionInput(BaseModel):
@@ -10,6 +14,30 @@ class PredictionInput(BaseModel):
     CO2: float
 
 
+class BatchReading(PredictionInput):
+    timestamp: Optional[datetime] = None
+
+    @field_validator('timestamp')
+    def normalize_timestamp(cls, v):
+        return to_naive_utc(v)
+
+
+class PredictionBatchInput(BaseModel):
+    readings: List[BatchReading] = Field(..., min_length=1, max_length=PREDICT_BATCH_MAX_SIZE)
+
+
+class PredictionResult(BaseModel):
+    mac_address: str
+    prediction: Optional[int] = None
+    recommendations: List[str] = []
+    error: Optional[str] = None
+
+
+class PredictionBatchResponse(BaseModel):
+    results: List[PredictionResult]
+    stored: int
+
+
 class ParameterStats(BaseModel):
     mean: Optional[float] = None
     median: Optional[float] = None
@@ -26,7 +54,10 @@ class TimeStats(BaseModel):
     start_time: Optional[str] = None
     end_time: Optional[str] = None
     duration: Optional[float] = None
+    # Назва поля збережена для сумісності з фронтендом; крок задається granularity
     hourly_trends: Optional[Dict[str, List[Optional[float]]]] = None
+    trend_timestamps: Optional[List[datetime]] = None
+    granularity: Optional[str] = None
 
 
 class StatisticsOutput(BaseModel):
@@ -41,6 +72,28 @@ class StatisticsOutput(BaseModel):
 class StatisticsInput(BaseModel):
     time_from: datetime
     time_to: datetime
+    aggregation: str = Field("rollup", pattern="^(pandas|sql|rollup|stream)$",
+                             description="Де рахувати статистику: з погодинних агрегатів measurement_hourly "
+                                         "(сирі рядки лише для неповних годин на краях вікна), pandas над сирими "
+                                         "рядками, агрегатами PostgreSQL або потоково блоками рядків "
+                                         "з обмеженим використанням пам'яті")
+    quantiles: Optional[str] = Field(None, pattern="^(exact|approx)$",
+                                     description="Медіана та квартилі: точні або з погодинних скетчів квантилів "
+                                                 "(лише для aggregation=rollup та stream). За замовчуванням approx "
+                                                 "для rollup і exact для решти")
+    granularity: str = Field("hour", pattern="^(minute|hour|day|week)$", description="Крок трендів")
+    max_points: Optional[int] = Field(None, ge=16, le=TRENDS_MAX_POINTS_LIMIT,
+                                      description="Максимальна кількість точок тренду; довші ряди проріджуються LTTB")
+
+    @field_validator('time_from', 'time_to')
+    def normalize_range(cls, v):
+        return to_naive_utc(v)
+
+    @model_validator(mode="after")
+    def default_quantiles(self):
+        if self.quantiles is None:
+            self.quantiles = "approx" if self.aggregation == "rollup" else "exact"
+        return self
 
 
 class RoomStatisticsInput(StatisticsInput):
@@ -49,3 +102,54 @@ class RoomStatisticsInput(StatisticsInput):
 
 class StatisticsResponse(BaseModel):
     statistics: List[StatisticsOutput]
+
+
+class AxisRange(BaseModel):
+    start: float = Field(allow_inf_nan=False)
+    stop: float = Field(allow_inf_nan=False)
+    step: Optional[float] = Field(None, gt=0, allow_inf_nan=False,
+                                  description="Крок сітки; якщо не задано, використовується points")
+    points: Optional[int] = Field(None, ge=1, description="Кількість рівномірних точок від start до stop")
+
+    @model_validator(mode="after")
+    def check_bounds(self):
+        if self.stop < self.start:
+            raise ValueError("stop не може бути меншим за start")
+        return self
+
+
+class SurfaceInput(BaseModel):
+    mac_address: Optional[str] = None
+    room_id: Optional[int] = None
+    config: Optional[ConfigImport] = None
+    temperature: Optional[AxisRange] = None
+    humidity: Optional[AxisRange] = None
+    co2: Optional[AxisRange] = None
+    slice_axis: Optional[str] = Field(None, pattern="^(temperature|humidity|co2)$",
+                                      description="Повернути 2D-зріз, зафіксувавши цю вісь")
+    slice_value: Optional[float] = Field(None, description="Значення зафіксованої осі; береться найближча точка сітки")
+
+    @model_validator(mode="after")
+    def check_source(self):
+        if sum(value is not None for value in (self.mac_address, self.room_id, self.config)) != 1:
+            raise ValueError("Потрібно вказати рівно одне з: mac_address, room_id або config")
+        if (self.slice_axis is None) != (self.slice_value is None):
+            raise ValueError("slice_axis та slice_value задаються разом")
+        return self
+
+
+class SurfaceOptimum(BaseModel):
+    temperature: float
+    humidity: float
+    co2: float
+    productivity: float
+
+
+class SurfaceResponse(BaseModel):
+    axes: Dict[str, List[float]]
+    # Порядок осей у surface; для зрізу зафіксована вісь відсутня
+    dimensions: List[str]
+    surface: Optional[Any] = None
+    fixed: Optional[Dict[str, float]] = None
+    optimum: SurfaceOptimum
+    points: int
@@ -7,9 +7,10 @@ from pydantic import BaseModel, validator
 
 class MeasurementRead(BaseModel):
     id: int
-    temperature: float
-    humidity: float
-    co2: float
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+    co2: Optional[float] = None
+    productivity: Optional[int] = None
     timestamp: datetime
 
     class Config:
@@ -24,11 +25,20 @@ class ConfigRead(BaseModel):
         from_attributes = True
 
 
+class MeasurementSummary(BaseModel):
+    measurement_count: int = 0
+    last_timestamp: Optional[datetime] = None
+    last_measurement: Optional[MeasurementRead] = None
+
+
 class DeviceRead(BaseModel):
     id: int
     mac_address: str
     room_id: Optional[int] = None
+    summary: MeasurementSummary = MeasurementSummary()
+    # Заповнюється лише з include_measurements: від найновіших, сторінками по measurements_limit
     measurements: List[MeasurementRead] = []
+    measurements_cursor: Optional[str] = None
     configs: List[ConfigRead] = []
 
     class Config:
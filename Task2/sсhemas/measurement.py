@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 
 class MeasurementExport(BaseModel):
@@ -11,6 +12,21 @@ class MeasurementExport(BaseModel):
     co2: float
 
 
+class MeasurementItem(BaseModel):
+    id: int
+    device_id: int
+    timestamp: datetime
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+    co2: Optional[float] = None
+    productivity: Optional[int] = None
+
+
+class MeasurementPage(BaseModel):
+    items: List[MeasurementItem]
+    next_cursor: Optional[str] = None
+
+
 class EnvironmentDataInput(BaseModel):
     device_id: int
     Temperature: float
@@ -0,0 +1,10 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+
+# Колонки timestamp зберігають наївний UTC, а asyncpg не приймає datetime з часовою зоною
+# для timestamp without time zone, тож значення з зоною переводяться в UTC і зона відкидається
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
@@ -23,6 +23,7 @@ class ESP32Simulator:
         self.dht22 = DHT22Simulator(self.config)
         self.mhz19 = MHZ19Simulator(self.config)
         self.running = True
+        self.config_changed = asyncio.Event()
 
     def get_config(self) -> DeviceConfig:
         config = self.server.get_config()
@@ -38,6 +39,36 @@ class ESP32Simulator:
                 min_co2=0, max_co2=1000, ideal_co2=500
             )
 
+    def apply_config(self, config: DeviceConfig):
+        if config != self.config:
+            print(f"[{self.mac_address}] Застосовано нову конфігурацію")
+            interval_changed = config.interval != self.config.interval
+            self.config = config
+            self.dht22.config = config
+            self.mhz19.config = config
+            if interval_changed:
+                self.config_changed.set()
+
+    async def watch_config(self):
+        # Зміни конфігурації приходять через SSE; після обриву потоку конфігурація перевіряється
+        # умовним запитом з If-None-Match, а підписка поновлюється з останнього ETag
+        loop = asyncio.get_running_loop()
+
+        def on_change(config: DeviceConfig):
+            loop.call_soon_threadsafe(self.apply_config, config)
+
+        while self.running:
+            try:
+                await asyncio.to_thread(self.server.watch_config, on_change)
+            except Exception as e:
+                print(f"[{self.mac_address}] Потік конфігурації перервано: {e}")
+            if not self.running:
+                break
+            await asyncio.sleep(5)
+            config = await asyncio.to_thread(self.server.get_config)
+            if config:
+                self.apply_config(config)
+
     async def read_sensors(self) -> tuple[float, float, int]:
         temperature, humidity = self.dht22.read()
         co2 = self.mhz19.read()
@@ -59,6 +90,14 @@ class ESP32Simulator:
             return None
 
     async def run(self):
+        watcher = asyncio.create_task(self.watch_config())
+        try:
+            await self._run()
+        finally:
+            self.stop()
+            watcher.cancel()
+
+    async def _run(self):
         while self.running:
             try:
                 temperature, humidity, co2 = await self.read_sensors()
@@ -72,7 +111,12 @@ class ESP32Simulator:
                         print(f"[{self.mac_address}] - {rec}")
 
                 if self.config.interval > 0:
-                    await asyncio.sleep(self.config.interval)
+                    # Новий інтервал застосовується одразу, не чекаючи завершення поточного
+                    self.config_changed.clear()
+                    try:
+                        await asyncio.wait_for(self.config_changed.wait(), self.config.interval)
+                    except asyncio.TimeoutError:
+                        pass
                 else:
                     print(f"[{self.mac_address}] Інтервал дорівнює 0, зупиняємо симулятор")
                     self.stop()
@@ -82,6 +126,7 @@ class ESP32Simulator:
 
     def stop(self):
         self.running = False
+        self.server.close_config_stream()
 
 async def run_simulator(server_url: str, mac_address: str):
     simulator = ESP32Simulator(server_url, mac_address)
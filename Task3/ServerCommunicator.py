@@ -1,5 +1,7 @@
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
+import json
+import socket
 import requests
 
 
@@ -22,28 +24,45 @@ class ServerCommunicator:
         self.base_url = base_url.rstrip('/')
         self.mac_address = mac_address
         self.headers = {"mac_address": self.mac_address}
+        self.config: Optional[DeviceConfig] = None
+        self.config_data: Optional[Dict[str, Any]] = None
+        self.config_etag: Optional[str] = None
+        self.config_stream: Optional[requests.Response] = None
+        self.config_stream_closed = False
+
+    def _apply_config(self, data: Dict[str, Any], etag: Optional[str]) -> DeviceConfig:
+        self.config_data = data
+        self.config_etag = etag
+        self.config = DeviceConfig(
+            interval=data['monitoring_settings']['Interval'],
+            min_temp=data['min_values']['Temperature'],
+            max_temp=data['max_values']['Temperature'],
+            ideal_temp=data['ideal_values']['Temperature'],
+            min_humidity=data['min_values']['Humidity'],
+            max_humidity=data['max_values']['Humidity'],
+            ideal_humidity=data['ideal_values']['Humidity'],
+            min_co2=data['min_values']['CO2'],
+            max_co2=data['max_values']['CO2'],
+            ideal_co2=data['ideal_values']['CO2']
+        )
+        return self.config
 
     def get_config(self) -> Optional[DeviceConfig]:
         try:
             url = f"{self.base_url}/admin/device/config"
+            headers = dict(self.headers)
+            if self.config is not None and self.config_etag:
+                headers["If-None-Match"] = self.config_etag
+            response = requests.get(url, headers=headers)
+            # Конфігурація не змінилася з останнього отримання — лишаємо збережену
+            if response.status_code == 304:
+                return self.config
             print(f"Отримання конфігу з: {url}")
-            print(f"Заголовки: {self.headers}")
-            response = requests.get(url, headers=self.headers)
+            print(f"Заголовки: {headers}")
             response.raise_for_status()
             data = response.json()
             print(f"Дані отримані з конфігу: {data}")
-            return DeviceConfig(
-                interval=data['monitoring_settings']['Interval'],
-                min_temp=data['min_values']['Temperature'],
-                max_temp=data['max_values']['Temperature'],
-                ideal_temp=data['ideal_values']['Temperature'],
-                min_humidity=data['min_values']['Humidity'],
-                max_humidity=data['max_values']['Humidity'],
-                ideal_humidity=data['ideal_values']['Humidity'],
-                min_co2=data['min_values']['CO2'],
-                max_co2=data['max_values']['CO2'],
-                ideal_co2=data['ideal_values']['CO2']
-            )
+            return self._apply_config(data, response.headers.get("ETag"))
         except requests.RequestException as e:
             print(f"Помилка при отриманні конфігу: {e}")
             if hasattr(e, 'response') and e.response:
@@ -51,6 +70,59 @@ class ServerCommunicator:
                 print(f"Контент: {e.response.text}")
             return None
 
+    def watch_config(self, on_change: Callable[[DeviceConfig], None]):
+        # Блокуюче читання потоку Server-Sent Events; повертається, коли сервер закриває з'єднання
+        url = f"{self.base_url}/admin/device/config/stream"
+        headers = dict(self.headers)
+        if self.config_etag:
+            headers["Last-Event-ID"] = self.config_etag
+        if self.config_stream_closed:
+            return
+        with requests.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+            self.config_stream = response
+            try:
+                if self.config_stream_closed:
+                    return
+                response.raise_for_status()
+                event, event_id, data = None, None, []
+                for line in response.iter_lines(decode_unicode=True):
+                    if self.config_stream_closed:
+                        return
+                    if line:
+                        field, _, value = line.partition(":")
+                        value = value[1:] if value.startswith(" ") else value
+                        if field == "event":
+                            event = value
+                        elif field == "id":
+                            event_id = value
+                        elif field == "data":
+                            data.append(value)
+                        continue
+                    if data and event == "config":
+                        on_change(self._apply_config(json.loads("\n".join(data)), event_id))
+                    elif data and event == "delta" and self.config_data is not None:
+                        on_change(self._apply_config({**self.config_data, **json.loads("\n".join(data))}, event_id))
+                    event, event_id, data = None, None, []
+            finally:
+                self.config_stream = None
+
+    def close_config_stream(self):
+        # Викликається з іншого потоку: heartbeat приходить частіше за таймаут читання, тому
+        # watch_config сам не повернеться. close() не перериває заблокований recv,
+        # тож спершу закривається сокет, і читання завершується помилкою
+        self.config_stream_closed = True
+        response = self.config_stream
+        if response is None:
+            return
+        connection = getattr(response.raw, "connection", None) or getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
+
     def send_data(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         try:
             url = f"{self.base_url}/analytics/predict"
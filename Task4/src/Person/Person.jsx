@@ -16,7 +16,12 @@ const Person = () => {
             return;
         }
         try {
-            await axios.put('/api/auth/password', { new_password: newPassword });
+            const response = await axios.put('/api/auth/password', { new_password: newPassword });
+            // Після зміни пароля попередні токени відкликаються, сервер повертає новий
+            if (response.data.access_token) {
+                localStorage.setItem('token', response.data.access_token);
+                axios.defaults.headers.common['Authorization'] = `Bearer ${response.data.access_token}`;
+            }
             setError('');
             setNewPassword('');
             setConfirmPassword('');
@@ -46,7 +46,9 @@ export const roomActions = () => {
 
     const fetchRoomDevices = async (roomId) => {
         try {
-            const response = await axios.get(`/api/admin/rooms/${roomId}/devices`);
+            const response = await axios.get(`/api/admin/rooms/${roomId}/devices`, {
+                params: { include_measurements: true, measurements_limit: 50 }
+            });
             return response.data;
         } catch (error) {
             console.error('Помилка при отриманні пристроїв кімнати:', error);